@@ -1,21 +1,42 @@
+import logging
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from src.core.config import settings
+from src.core.database import engine
+from src.core.metrics import MetricsMiddleware, metrics
+from src.core.router import metrics_router
+from src.core.router import router as service_router
+from src.core.warmup import warm_up_cache
 from src.dish.router import router as dish_router
 from src.menu.router import router as menu_router
 from src.redis.utils import redis
 from src.submenu.router import router as submenu_router
 
+logger = logging.getLogger(__name__)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator:
-    r = redis.get_redis_client()
+    await redis.connect()
+    redis.start_listener()
+    metrics.start_flusher(redis.get_redis_client())
+
+    if settings.cache_warmup_on_startup:
+        try:
+            await warm_up_cache()
+        except Exception:
+            # a cold cache is slower, not broken
+            logger.warning('cache warm-up failed', exc_info=True)
+
     yield
-    r.close()
+    await metrics.stop_flusher(redis.get_redis_client())
+    await redis.close()
+    await engine.dispose()
 
 
 app = FastAPI(
@@ -23,6 +44,7 @@ app = FastAPI(
     description='Home work for internship',
     version='0.0.1',
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 
@@ -32,7 +54,9 @@ app.add_middleware(
     allow_credentials=settings.cors_allow_credentials,
     allow_methods=settings.cors_allow_methods,
     allow_headers=settings.cors_allow_headers,
+    expose_headers=settings.cors_expose_headers,
 )
+app.add_middleware(MetricsMiddleware)
 
 
 api_prefix = settings.api_v1_prefix
@@ -40,3 +64,5 @@ api_prefix = settings.api_v1_prefix
 app.include_router(router=menu_router, prefix=api_prefix)
 app.include_router(router=submenu_router, prefix=api_prefix)
 app.include_router(router=dish_router, prefix=api_prefix)
+app.include_router(router=service_router, prefix=api_prefix)
+app.include_router(router=metrics_router)
@@ -0,0 +1,125 @@
+"""Counter columns
+
+Revision ID: 3b8f1c2d9e47
+Revises: ecef9ed3e680
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from typing import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8f1c2d9e47'
+down_revision: str | None = 'ecef9ed3e680'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column('menu', sa.Column('submenus_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('menu', sa.Column('dishes_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('submenu', sa.Column('dishes_count', sa.Integer(), server_default='0', nullable=False))
+
+    # backfill existing data before the triggers take over
+    op.execute(
+        '''
+        UPDATE submenu
+        SET dishes_count = (SELECT count(*) FROM dish WHERE dish.submenu_id = submenu.id)
+        '''
+    )
+    op.execute(
+        '''
+        UPDATE menu
+        SET submenus_count = (SELECT count(*) FROM submenu WHERE submenu.menu_id = menu.id),
+            dishes_count = (
+                SELECT coalesce(sum(submenu.dishes_count), 0)
+                FROM submenu WHERE submenu.menu_id = menu.id
+            )
+        '''
+    )
+
+    op.execute(
+        '''
+        CREATE OR REPLACE FUNCTION submenu_counters() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE menu
+                SET submenus_count = submenus_count + 1,
+                    dishes_count = dishes_count + NEW.dishes_count
+                WHERE id = NEW.menu_id;
+            END IF;
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE menu
+                SET submenus_count = submenus_count - 1,
+                    dishes_count = dishes_count - OLD.dishes_count
+                WHERE id = OLD.menu_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        '''
+    )
+    op.execute(
+        '''
+        CREATE TRIGGER submenu_counters_insert_delete
+        AFTER INSERT OR DELETE ON submenu
+        FOR EACH ROW EXECUTE FUNCTION submenu_counters()
+        '''
+    )
+    op.execute(
+        '''
+        CREATE TRIGGER submenu_counters_update
+        AFTER UPDATE OF menu_id ON submenu
+        FOR EACH ROW WHEN (OLD.menu_id IS DISTINCT FROM NEW.menu_id)
+        EXECUTE FUNCTION submenu_counters()
+        '''
+    )
+    op.execute(
+        '''
+        CREATE OR REPLACE FUNCTION dish_counters() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE submenu SET dishes_count = dishes_count + 1 WHERE id = NEW.submenu_id;
+                UPDATE menu SET dishes_count = dishes_count + 1
+                WHERE id = (SELECT menu_id FROM submenu WHERE id = NEW.submenu_id);
+            END IF;
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE submenu SET dishes_count = dishes_count - 1 WHERE id = OLD.submenu_id;
+                UPDATE menu SET dishes_count = dishes_count - 1
+                WHERE id = (SELECT menu_id FROM submenu WHERE id = OLD.submenu_id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        '''
+    )
+    op.execute(
+        '''
+        CREATE TRIGGER dish_counters_insert_delete
+        AFTER INSERT OR DELETE ON dish
+        FOR EACH ROW EXECUTE FUNCTION dish_counters()
+        '''
+    )
+    op.execute(
+        '''
+        CREATE TRIGGER dish_counters_update
+        AFTER UPDATE OF submenu_id ON dish
+        FOR EACH ROW WHEN (OLD.submenu_id IS DISTINCT FROM NEW.submenu_id)
+        EXECUTE FUNCTION dish_counters()
+        '''
+    )
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS dish_counters_update ON dish')
+    op.execute('DROP TRIGGER IF EXISTS dish_counters_insert_delete ON dish')
+    op.execute('DROP FUNCTION IF EXISTS dish_counters()')
+    op.execute('DROP TRIGGER IF EXISTS submenu_counters_update ON submenu')
+    op.execute('DROP TRIGGER IF EXISTS submenu_counters_insert_delete ON submenu')
+    op.execute('DROP FUNCTION IF EXISTS submenu_counters()')
+
+    op.drop_column('submenu', 'dishes_count')
+    op.drop_column('menu', 'dishes_count')
+    op.drop_column('menu', 'submenus_count')
@@ -0,0 +1,63 @@
+"""Indexes and unique titles
+
+Revision ID: 8d41a7e5c2b0
+Revises: 3b8f1c2d9e47
+Create Date: 2026-10-18 11:02:17.640291
+
+"""
+from typing import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41a7e5c2b0'
+down_revision: str | None = '3b8f1c2d9e47'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+TITLED_TABLES = ('menu', 'submenu', 'dish')
+
+
+def check_unique_titles() -> None:
+    """
+    Submenus and dishes were only unique within their parent before, fail with
+    the list of duplicates instead of a bare constraint violation.
+    """
+    if op.get_context().as_sql:
+        return
+
+    duplicates: list[str] = []
+
+    for table in TITLED_TABLES:
+        rows = op.get_bind().execute(
+            sa.text(f'SELECT title, count(*) FROM {table} GROUP BY title HAVING count(*) > 1 ORDER BY title')
+        )
+        duplicates.extend(f'{table} {title!r} x{count}' for title, count in rows)
+
+    if duplicates:
+        raise RuntimeError(
+            'titles must be unique, rename these rows (in the google sheet too) and upgrade again: '
+            + ', '.join(duplicates)
+        )
+
+
+def upgrade() -> None:
+    check_unique_titles()
+
+    op.create_index('ix_submenu_menu_id_id', 'submenu', ['menu_id', 'id'])
+    op.create_index('ix_dish_submenu_id', 'dish', ['submenu_id'])
+
+    # deferred to commit, the sync renames and deletes rows in one transaction in any order
+    for table in TITLED_TABLES:
+        op.create_unique_constraint(f'{table}_title_key', table, ['title'], deferrable=True, initially='DEFERRED')
+
+
+def downgrade() -> None:
+    op.drop_constraint('dish_title_key', 'dish', type_='unique')
+    op.drop_constraint('submenu_title_key', 'submenu', type_='unique')
+    op.drop_constraint('menu_title_key', 'menu', type_='unique')
+
+    op.drop_index('ix_dish_submenu_id', table_name='dish')
+    op.drop_index('ix_submenu_menu_id_id', table_name='submenu')
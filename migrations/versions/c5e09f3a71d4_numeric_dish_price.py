@@ -0,0 +1,41 @@
+"""Numeric dish price
+
+Revision ID: c5e09f3a71d4
+Revises: 8d41a7e5c2b0
+Create Date: 2026-10-18 11:47:55.102873
+
+"""
+from typing import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e09f3a71d4'
+down_revision: str | None = '8d41a7e5c2b0'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.alter_column(
+        'dish',
+        'price',
+        type_=sa.Numeric(10, 2),
+        existing_type=sa.String(),
+        existing_nullable=False,
+        postgresql_using="round(coalesce(nullif(trim(price), ''), '0')::numeric, 2)",
+    )
+    op.create_index('ix_dish_price', 'dish', ['price'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_dish_price', table_name='dish')
+    op.alter_column(
+        'dish',
+        'price',
+        type_=sa.String(),
+        existing_type=sa.Numeric(10, 2),
+        existing_nullable=False,
+        postgresql_using='price::text',
+    )
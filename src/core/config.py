@@ -20,6 +20,9 @@ DB_NAME_TEST = os.environ.get('DB_NAME_TEST')
 DB_USER_TEST = os.environ.get('DB_USER_TEST')
 DB_PASS_TEST = os.environ.get('DB_PASS_TEST')
 
+REDIS_HOST = os.environ.get('REDIS_HOST', 'redis')
+REDIS_PORT = os.environ.get('REDIS_PORT', '6379')
+
 GOOGLE_SHEET_URL = os.environ.get('GOOGLE_SHEET_URL')
 
 BASE_DIR = Path(__file__).parent.parent
@@ -37,6 +40,12 @@ headers = [
     'Access-Control-Allow-Headers',
     'Access-Control-Allow-Origin',
     'Authorization',
+    'If-None-Match',
+]
+
+expose_headers = [
+    'X-Next-Cursor',
+    'ETag',
 ]
 
 
@@ -45,12 +54,44 @@ class AppSettings(BaseSettings):
     db_url: str = f'postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}?async_fallback=True'
     test_db_url: str = f'postgresql+asyncpg://{DB_USER_TEST}:{DB_PASS_TEST}@{DB_HOST_TEST}:{DB_PORT_TEST}/{DB_NAME_TEST}?async_fallback=True'
 
+    db_null_pool: bool = False
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_pool_timeout: float = 10.0
+
+    redis_host: str = REDIS_HOST
+    redis_port: int = int(REDIS_PORT)
+    redis_max_connections: int = 50
+    redis_max_cached_pages: int = 64
+
+    cache_local_max_bytes: int = 32 * 1024 * 1024
+    cache_local_ttl: int = 60
+    cache_local_max_generations: int = 10000
+    cache_local_generation_ttl: int = 5
+
+    cache_soft_ttl: int = 30
+    cache_compression: str = 'zlib'
+    cache_compress_min_bytes: int = 1024
+    cache_compress_level: int = 6
+
+    cache_warmup_on_startup: bool = True
+    cache_warmup_concurrency: int = 8
+
+    cache_lock_ttl_ms: int = 5000
+    cache_lock_wait: float = 1.0
+    cache_lock_poll_interval: float = 0.05
+
+    metrics_flush_interval: float = 5.0
+
     google_sheet_url: str | None = GOOGLE_SHEET_URL
 
     cors_allow_origins: list[str] = Field(default=origins, exclude=True)
     cors_allow_credentials: bool = Field(default=True, exclude=True)
     cors_allow_methods: list[str] = Field(default=methods, exclude=True)
     cors_allow_headers: list[str] = Field(default=headers, exclude=True)
+    cors_expose_headers: list[str] = Field(default=expose_headers, exclude=True)
 
 
 settings = AppSettings()
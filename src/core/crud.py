@@ -0,0 +1,70 @@
+import uuid
+from typing import Any, Iterable, TypeVar
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.base import Base
+
+ModelT = TypeVar('ModelT', bound=Base)
+
+
+async def upsert_rows(
+    session: AsyncSession,
+    model: type[ModelT],
+    rows: list[dict[str, Any]],
+    commit: bool = True,
+) -> list[ModelT]:
+    """
+    INSERT ... ON CONFLICT (id) DO UPDATE ... RETURNING for many rows at once, rows
+    without an id get a new one. All rows must have the same keys, these are the
+    columns written on conflict. Batching is left to sqlalchemy's insertmanyvalues.
+    """
+    if not rows:
+        return []
+
+    rows = [{'id': uuid.uuid4(), **row} for row in rows]
+    # bulk RETURNING hands back objects already in the session as they are, old values included
+    mapper = model.__mapper__
+    loaded = [
+        row['id'] for row in rows
+        if mapper.identity_key_from_primary_key((uuid.UUID(str(row['id'])),)) in session.identity_map
+    ]
+
+    query = insert(model)
+    query = query.on_conflict_do_update(
+        index_elements=[model.id],
+        set_={name: query.excluded[name] for name in rows[0] if name != 'id'},
+    )
+    result = await session.scalars(query.returning(model), rows)
+    objects = result.all()
+
+    if loaded:
+        await session.execute(
+            select(model).where(model.id.in_(loaded)).execution_options(populate_existing=True)
+        )
+
+    if commit:
+        await session.commit()
+
+    return objects
+
+
+async def delete_rows(
+    session: AsyncSession,
+    model: type[Base],
+    ids: Iterable[uuid.UUID | str],
+    commit: bool = True,
+) -> int:
+    ids = list(ids)
+    if not ids:
+        return 0
+
+    query = delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False)
+    result = await session.execute(query)
+
+    if commit:
+        await session.commit()
+
+    return result.rowcount
@@ -1,15 +1,106 @@
+import time
 from contextlib import asynccontextmanager
+from typing import Any
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 
 from src.core.config import settings
+from src.core.metrics import DB, DB_POOL, metrics
 
-engine = create_async_engine(settings.db_url, poolclass=NullPool, echo=False)
+
+class PoolStats:
+    def __init__(self) -> None:
+        self.waiters = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def record_wait(self, wait_time: float) -> None:
+        self.checkouts += 1
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+        metrics.histogram(DB_POOL).observe(wait_time)
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long callers wait for a free connection.
+    """
+
+    def _do_get(self) -> Any:
+        pool_stats.waiters += 1
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.waiters -= 1
+            pool_stats.record_wait(time.perf_counter() - start)
+
+
+def instrument(engine: AsyncEngine) -> AsyncEngine:
+    # the start goes on the execution context, a statement that fails leaves nothing behind
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn: Any, cursor: Any, statement: str, params: Any, context: Any, *args: Any) -> None:
+        context.query_start = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn: Any, cursor: Any, statement: str, params: Any, context: Any, *args: Any) -> None:
+        elapsed = time.perf_counter() - context.query_start
+        metrics.histogram(DB, statement=statement.lstrip().split(None, 1)[0].upper()).observe(elapsed)
+
+    return engine
+
+
+def build_engine(db_url: str, null_pool: bool = settings.db_null_pool) -> AsyncEngine:
+    if null_pool:
+        return instrument(create_async_engine(db_url, poolclass=NullPool, echo=False))
+
+    return instrument(create_async_engine(
+        db_url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        pool_timeout=settings.db_pool_timeout,
+        echo=False,
+    ))
+
+
+engine = build_engine(settings.db_url)
 async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
+def get_pool_status() -> dict[str, Any]:
+    pool = engine.pool
+
+    if not isinstance(pool, InstrumentedQueuePool):
+        return {'pool': pool.status()}
+
+    return {
+        'pool': pool.status(),
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        'waiters': pool_stats.waiters,
+        'checkouts': pool_stats.checkouts,
+        'timeouts': pool_stats.timeouts,
+        'wait_time_total': round(pool_stats.wait_time_total, 6),
+        'wait_time_max': round(pool_stats.wait_time_max, 6),
+    }
+
+
 async def get_async_session() -> AsyncSession:
     async with async_session_maker() as session:
         yield session
@@ -0,0 +1,248 @@
+"""
+Prometheus metrics.
+
+Every worker only bumps plain counters of its own (one event loop, no locks on the
+hot path) and periodically adds what changed since the last flush to the METRICS_KEY
+redis hash. /metrics renders the hash, so it shows the sum over all workers and the
+celery task no matter which worker answers the scrape.
+"""
+import asyncio
+import bisect
+import logging
+import re
+import time
+from collections import defaultdict
+from typing import Any
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from src.core.config import settings
+from src.redis.stats import cache_stats
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = 'metrics'
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP = 'cafe_http_request_duration_seconds'
+REDIS = 'cafe_redis_command_duration_seconds'
+DB = 'cafe_db_query_duration_seconds'
+DB_POOL = 'cafe_db_pool_wait_seconds'
+SYNC = 'cafe_sync_phase_duration_seconds'
+
+HELP = {
+    HTTP: ('histogram', 'HTTP request latency by route'),
+    REDIS: ('histogram', 'Redis round trip latency by command'),
+    DB: ('histogram', 'Database statement latency by statement type'),
+    DB_POOL: ('histogram', 'Time spent waiting for a pooled database connection'),
+    SYNC: ('histogram', 'Duration of each phase of the google sheet sync'),
+    'cafe_cache_hits_total': ('counter', 'Cache hits by key family and layer'),
+    'cafe_cache_stale_hits_total': ('counter', 'Redis cache hits served stale while refreshed'),
+    'cafe_cache_misses_total': ('counter', 'Cache misses by key family'),
+    'cafe_cache_writes_total': ('counter', 'Cache writes by key family'),
+    'cafe_cache_written_bytes_total': ('counter', 'Bytes written to redis by key family'),
+}
+
+SAMPLE = re.compile(r'^(?P<name>\w+?)(?P<suffix>_bucket|_sum|_count)?(?:\{(?P<labels>.*)\})?$')
+LE = re.compile(r',?le="([^"]+)"')
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def sample_name(name: str, **labels: str) -> str:
+    if not labels:
+        return name
+
+    pairs = ','.join(f'{key}="{escape(value)}"' for key, value in labels.items())
+
+    return f'{name}{{{pairs}}}'
+
+
+class Histogram:
+    def __init__(self) -> None:
+        # the last bucket is +Inf
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, **labels: str) -> dict[str, float]:
+        samples = {}
+        cumulative = 0
+
+        for bound, count in zip((*map(str, LATENCY_BUCKETS), '+Inf'), self.buckets):
+            cumulative += count
+            samples[sample_name(f'{name}_bucket', **labels, le=bound)] = cumulative
+
+        samples[sample_name(f'{name}_sum', **labels)] = self.sum
+        samples[sample_name(f'{name}_count', **labels)] = self.count
+
+        return samples
+
+
+class Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram) -> None:
+        self.histogram = histogram
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.histograms: defaultdict[tuple[str, tuple[tuple[str, str], ...]], Histogram] = defaultdict(Histogram)
+        self.flushed: dict[str, float] = {}
+        self.flusher: asyncio.Task | None = None
+        # /metrics and the periodic flusher must not send the same deltas twice
+        self.flush_lock = asyncio.Lock()
+
+    def histogram(self, name: str, **labels: str) -> Histogram:
+        return self.histograms[name, tuple(labels.items())]
+
+    def timed(self, name: str, **labels: str) -> Timer:
+        return Timer(self.histogram(name, **labels))
+
+    def collect(self) -> dict[str, float]:
+        samples = {}
+
+        for (name, labels), histogram in list(self.histograms.items()):
+            samples.update(histogram.samples(name, **dict(labels)))
+
+        for family, stats in list(cache_stats.families.items()):
+            samples.update({
+                sample_name('cafe_cache_hits_total', family=family, layer='local'): stats.local_hits,
+                sample_name('cafe_cache_hits_total', family=family, layer='redis'): stats.hits,
+                sample_name('cafe_cache_stale_hits_total', family=family): stats.stale_hits,
+                sample_name('cafe_cache_misses_total', family=family): stats.misses,
+                sample_name('cafe_cache_writes_total', family=family): stats.writes,
+                sample_name('cafe_cache_written_bytes_total', family=family): stats.bytes_written,
+            })
+
+        return samples
+
+    async def flush(self, client: Redis) -> None:
+        async with self.flush_lock:
+            samples = self.collect()
+            deltas = {name: value - self.flushed.get(name, 0) for name, value in samples.items()}
+            deltas = {name: delta for name, delta in deltas.items() if delta}
+
+            if not deltas:
+                return
+
+            async with client.pipeline(transaction=False) as pipe:
+                for name, delta in deltas.items():
+                    if isinstance(delta, int):
+                        pipe.hincrby(METRICS_KEY, name, delta)
+                    else:
+                        pipe.hincrbyfloat(METRICS_KEY, name, delta)
+                await pipe.execute()
+
+            # only what actually reached redis counts as flushed
+            self.flushed.update({name: samples[name] for name in deltas})
+
+    def start_flusher(self, client: Redis) -> None:
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self.flush_periodically(client))
+
+    async def stop_flusher(self, client: Redis) -> None:
+        if self.flusher is not None:
+            self.flusher.cancel()
+            try:
+                await self.flusher
+            except asyncio.CancelledError:
+                pass
+
+            self.flusher = None
+
+        try:
+            await self.flush(client)
+        except RedisError:
+            logger.warning('final metrics flush failed', exc_info=True)
+
+    async def flush_periodically(self, client: Redis) -> None:
+        while True:
+            await asyncio.sleep(settings.metrics_flush_interval)
+            try:
+                await self.flush(client)
+            except RedisError:
+                # deltas are kept and go out with the next flush
+                logger.warning('metrics flush failed', exc_info=True)
+
+
+metrics = Metrics()
+
+
+def sort_key(sample: str) -> tuple:
+    match = SAMPLE.match(sample)
+    labels = match['labels'] or ''
+    le = LE.search(labels)
+    bound = float(le[1]) if le else 0.0
+
+    return match['name'], LE.sub('', labels), ('_bucket', None, '_sum', '_count').index(match['suffix']), bound
+
+
+def render(samples: dict[str, str]) -> str:
+    lines = []
+    current = None
+
+    for sample in sorted(samples, key=sort_key):
+        name = SAMPLE.match(sample)['name']
+
+        if name != current:
+            current = name
+            kind, description = HELP.get(name, ('untyped', name))
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        lines.append(f'{sample} {samples[sample]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """
+    Records the latency of every http request, labeled with the name of the
+    endpoint that handled it, not the raw path, to keep the label set bounded.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = scope.get('endpoint')
+            metrics.histogram(
+                HTTP,
+                route=getattr(endpoint, '__name__', 'unmatched'),
+                method=scope['method'],
+                status=str(status_code),
+            ).observe(time.perf_counter() - start)
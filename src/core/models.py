@@ -1,12 +1,33 @@
-from sqlalchemy import ForeignKey, String
+from decimal import Decimal
+
+from sqlalchemy import (
+    DDL,
+    ForeignKey,
+    Index,
+    Integer,
+    Numeric,
+    String,
+    UniqueConstraint,
+    event,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from src.core.base import Base
+from src.core.triggers import DISH_TRIGGERS, SUBMENU_TRIGGERS
+
+
+def unique_title(table: str) -> UniqueConstraint:
+    # checked at commit, so that a sync can rename and delete rows in any order
+    return UniqueConstraint('title', name=f'{table}_title_key', deferrable=True, initially='DEFERRED')
 
 
 class Menu(Base):
+    __table_args__ = (unique_title('menu'),)
+
     title: Mapped[str] = mapped_column(String, nullable=False)
     description: Mapped[str] = mapped_column(String)
+    submenus_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
+    dishes_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
     submenus: Mapped[list['SubMenu']] = relationship(
         'SubMenu', cascade='all, delete-orphan',
         back_populates='menu'
@@ -14,18 +35,30 @@ class Menu(Base):
 
 
 class SubMenu(Base):
+    __table_args__ = (Index('ix_submenu_menu_id_id', 'menu_id', 'id'), unique_title('submenu'))
+
     title: Mapped[str] = mapped_column(String, nullable=False)
     description: Mapped[str] = mapped_column(String)
     menu_id: Mapped[int] = mapped_column(ForeignKey('menu.id', ondelete='CASCADE'))
+    dishes_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
     menu = relationship('Menu', back_populates='submenus')
     dishes: Mapped[list['Dish']] = relationship('Dish', back_populates='submenu', cascade='all, delete-orphan')
 
 
 class Dish(Base):
+    __table_args__ = (unique_title('dish'),)
+
     title: Mapped[str] = mapped_column(String, nullable=False)
     description: Mapped[str] = mapped_column(String)
-    price: Mapped[str] = mapped_column(String)
+    price: Mapped[Decimal] = mapped_column(Numeric(10, 2), index=True)
     submenu_id: Mapped[int] = mapped_column(
-        ForeignKey('submenu.id', ondelete='CASCADE')
+        ForeignKey('submenu.id', ondelete='CASCADE'), index=True
     )
     submenu = relationship('SubMenu', back_populates='dishes')
+
+
+for statement in SUBMENU_TRIGGERS:
+    event.listen(SubMenu.__table__, 'after_create', DDL(statement))
+
+for statement in DISH_TRIGGERS:
+    event.listen(Dish.__table__, 'after_create', DDL(statement))
@@ -0,0 +1,38 @@
+import base64
+import binascii
+import uuid
+from typing import Any
+
+from fastapi import HTTPException, Response, status
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def encode_cursor(last_id: uuid.UUID | str) -> str:
+    if not isinstance(last_id, uuid.UUID):
+        last_id = uuid.UUID(str(last_id))
+
+    return base64.urlsafe_b64encode(last_id.bytes).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str | None) -> uuid.UUID | None:
+    if not cursor:
+        return None
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return uuid.UUID(bytes=raw)
+    except (binascii.Error, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail='invalid cursor'
+        )
+
+
+def set_next_cursor(response: Response, items: list[Any], limit: int) -> None:
+    if not items or len(items) < limit:
+        return
+
+    last = items[-1]
+    last_id = last['id'] if isinstance(last, dict) else last.id
+
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last_id)
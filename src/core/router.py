@@ -0,0 +1,58 @@
+from fastapi import APIRouter, status
+from fastapi.responses import PlainTextResponse
+
+from src.core.database import get_pool_status
+from src.core.metrics import METRICS_KEY, metrics, render
+from src.core.schemas import CacheFamilyStatus, PoolStatus
+from src.redis.stats import cache_stats
+from src.redis.utils import redis
+
+router = APIRouter(tags=['Service'], prefix='/service')
+metrics_router = APIRouter(tags=['Service'])
+
+
+@router.get(
+    '/db-pool',
+    response_model=PoolStatus,
+    status_code=status.HTTP_200_OK,
+    summary='Состояние пула соединений с БД',
+)
+async def db_pool_status() -> PoolStatus:
+    """
+    \f
+    :return: pool status
+    """
+
+    return get_pool_status()
+
+
+@router.get(
+    '/cache',
+    response_model=dict[str, CacheFamilyStatus],
+    status_code=status.HTTP_200_OK,
+    summary='Статистика кеша по семействам ключей',
+)
+async def cache_status() -> dict[str, CacheFamilyStatus]:
+    """
+    \f
+    :return: hits, misses and stored sizes per key family of this worker
+    """
+
+    return cache_stats.as_dict()
+
+
+@metrics_router.get(
+    '/metrics',
+    response_class=PlainTextResponse,
+    status_code=status.HTTP_200_OK,
+    summary='Метрики в формате Prometheus',
+)
+async def prometheus_metrics() -> PlainTextResponse:
+    """
+    \f
+    :return: counters and latency histograms summed over all workers
+    """
+    r = redis.get_redis_client()
+    await metrics.flush(r)
+
+    return PlainTextResponse(render(await r.hgetall(METRICS_KEY)), media_type='text/plain; version=0.0.4')
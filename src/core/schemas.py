@@ -8,3 +8,29 @@ class ErrorResponse(BaseModel):
 class SuccessResponse(BaseModel):
     status: bool
     message: str
+
+
+class PoolStatus(BaseModel):
+    pool: str
+    size: int | None = None
+    checked_in: int | None = None
+    checked_out: int | None = None
+    overflow: int | None = None
+    waiters: int | None = None
+    checkouts: int | None = None
+    timeouts: int | None = None
+    wait_time_total: float | None = None
+    wait_time_max: float | None = None
+
+
+class CacheFamilyStatus(BaseModel):
+    local_hits: int
+    hits: int
+    stale_hits: int
+    misses: int
+    writes: int
+    bytes_written: int
+    payload_bytes_written: int
+    max_entry_bytes: int
+    hit_ratio: float
+    avg_entry_bytes: int
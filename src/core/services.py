@@ -1,6 +1,14 @@
-from typing import Callable
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable
 
-from fastapi import BackgroundTasks
+from fastapi import BackgroundTasks, HTTPException, Request, Response, status
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.database import get_async_context
+from src.redis.codec import make_etag
+
+UNIQUE_VIOLATION = '23505'
 
 
 async def create_background_task(
@@ -10,3 +18,41 @@ async def create_background_task(
 ) -> None:
 
     background_tasks.add_task(func, *args)
+
+
+@asynccontextmanager
+async def conflict_on_integrity_error(
+    session: AsyncSession,
+    detail: str,
+) -> AsyncIterator[None]:
+    try:
+        yield
+    except IntegrityError as exc:
+        await session.rollback()
+
+        # only a taken title is the client's conflict, fk and not null violations are not
+        if getattr(exc.orig, 'sqlstate', None) != UNIQUE_VIOLATION:
+            raise
+
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=detail)
+
+
+def json_response(content: str | bytes, request: Request, etag: str | None = None) -> Response:
+    """
+    Sends an already serialized body with a strong ETag, or 304 when the
+    client has it already. Cached entries carry their etag, so hits don't hash.
+    """
+    etag = etag or make_etag(content)
+    headers = {'ETag': etag}
+
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(content=content, media_type='application/json', headers=headers)
+
+
+async def in_new_session(load: Callable[[AsyncSession], Awaitable[Any]]) -> None:
+    # background refreshes outlive the request and its session
+    async with get_async_context() as session:
+        await load(session)
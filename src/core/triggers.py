@@ -0,0 +1,82 @@
+"""
+Triggers keeping the submenu/dish counters on menu and submenu up to date.
+Migration 3b8f1c2d9e47 installs the same functions on existing databases.
+"""
+
+SUBMENU_COUNTERS_FUNCTION = '''
+CREATE OR REPLACE FUNCTION submenu_counters() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE menu
+        SET submenus_count = submenus_count + 1,
+            dishes_count = dishes_count + NEW.dishes_count
+        WHERE id = NEW.menu_id;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE menu
+        SET submenus_count = submenus_count - 1,
+            dishes_count = dishes_count - OLD.dishes_count
+        WHERE id = OLD.menu_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+'''
+
+SUBMENU_COUNTERS_INSERT_DELETE_TRIGGER = '''
+CREATE TRIGGER submenu_counters_insert_delete
+AFTER INSERT OR DELETE ON submenu
+FOR EACH ROW EXECUTE FUNCTION submenu_counters()
+'''
+
+SUBMENU_COUNTERS_UPDATE_TRIGGER = '''
+CREATE TRIGGER submenu_counters_update
+AFTER UPDATE OF menu_id ON submenu
+FOR EACH ROW WHEN (OLD.menu_id IS DISTINCT FROM NEW.menu_id)
+EXECUTE FUNCTION submenu_counters()
+'''
+
+# when a whole submenu is deleted its dishes no longer find the parent row,
+# so the menu counter is decremented only once by submenu_counters()
+DISH_COUNTERS_FUNCTION = '''
+CREATE OR REPLACE FUNCTION dish_counters() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE submenu SET dishes_count = dishes_count + 1 WHERE id = NEW.submenu_id;
+        UPDATE menu SET dishes_count = dishes_count + 1
+        WHERE id = (SELECT menu_id FROM submenu WHERE id = NEW.submenu_id);
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE submenu SET dishes_count = dishes_count - 1 WHERE id = OLD.submenu_id;
+        UPDATE menu SET dishes_count = dishes_count - 1
+        WHERE id = (SELECT menu_id FROM submenu WHERE id = OLD.submenu_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+'''
+
+DISH_COUNTERS_INSERT_DELETE_TRIGGER = '''
+CREATE TRIGGER dish_counters_insert_delete
+AFTER INSERT OR DELETE ON dish
+FOR EACH ROW EXECUTE FUNCTION dish_counters()
+'''
+
+DISH_COUNTERS_UPDATE_TRIGGER = '''
+CREATE TRIGGER dish_counters_update
+AFTER UPDATE OF submenu_id ON dish
+FOR EACH ROW WHEN (OLD.submenu_id IS DISTINCT FROM NEW.submenu_id)
+EXECUTE FUNCTION dish_counters()
+'''
+
+SUBMENU_TRIGGERS = [
+    SUBMENU_COUNTERS_FUNCTION,
+    SUBMENU_COUNTERS_INSERT_DELETE_TRIGGER,
+    SUBMENU_COUNTERS_UPDATE_TRIGGER,
+]
+
+DISH_TRIGGERS = [
+    DISH_COUNTERS_FUNCTION,
+    DISH_COUNTERS_INSERT_DELETE_TRIGGER,
+    DISH_COUNTERS_UPDATE_TRIGGER,
+]
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import AsyncContextManager, Callable
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.config import settings
+from src.core.database import get_async_context
+from src.dish.services import get_dish_cache, load_all_dishes, load_dish
+from src.menu.schemas import MenuRead
+from src.menu.services import (
+    get_menu_cache,
+    load_all_menus,
+    load_all_menus_nested,
+    load_menu,
+)
+from src.redis.utils import revalidating_inline
+from src.submenu.schemas import SubMenuRead
+from src.submenu.services import get_submenu_cache, load_all_submenus, load_submenu
+
+logger = logging.getLogger(__name__)
+
+FIRST_PAGE = 100
+
+SessionFactory = Callable[[], AsyncContextManager[AsyncSession]]
+
+
+async def warm_menu(new_session: SessionFactory, semaphore: asyncio.Semaphore, menu: MenuRead) -> list[SubMenuRead]:
+    async with semaphore, new_session() as session:
+        cache_key, cache = await get_menu_cache(menu.id)
+        if not cache:
+            await load_menu(session, menu.id, cache_key)
+
+        submenus = await load_all_submenus(session, menu, 0, FIRST_PAGE)
+
+    return [SubMenuRead.model_validate(submenu) for submenu in jsonable_encoder(submenus)]
+
+
+async def warm_submenu(
+    new_session: SessionFactory, semaphore: asyncio.Semaphore, menu_id: uuid.UUID, submenu_id: uuid.UUID
+) -> None:
+    async with semaphore, new_session() as session:
+        cache_key, cache = await get_submenu_cache(menu_id, submenu_id)
+        if not cache:
+            await load_submenu(session, submenu_id, menu_id, cache_key)
+
+
+async def warm_dish(
+    new_session: SessionFactory,
+    semaphore: asyncio.Semaphore,
+    menu_id: uuid.UUID,
+    submenu_id: uuid.UUID,
+    dish_id: uuid.UUID,
+) -> None:
+    async with semaphore, new_session() as session:
+        cache_key, cache = await get_dish_cache(menu_id, submenu_id, dish_id)
+        if not cache:
+            await load_dish(session, dish_id, menu_id, submenu_id, cache_key)
+
+
+async def warm_up_cache(new_session: SessionFactory = get_async_context) -> float:
+    """
+    Fills the nested tree, the first page of every list and every entity on it,
+    stale entries are recomputed. Returns the time it took.
+    """
+    start = time.perf_counter()
+    semaphore = asyncio.Semaphore(settings.cache_warmup_concurrency)
+
+    with revalidating_inline():
+        async with new_session() as session:
+            menus = jsonable_encoder(await load_all_menus(session, 0, FIRST_PAGE))
+            await load_all_menus_nested(session, 0, FIRST_PAGE)
+            dishes = jsonable_encoder(await load_all_dishes(session, 0, FIRST_PAGE))
+
+        menus = [MenuRead.model_validate(menu) for menu in menus]
+        submenus_by_menu = await asyncio.gather(*[warm_menu(new_session, semaphore, menu) for menu in menus])
+
+        menu_ids = {
+            submenu.id: menu.id
+            for menu, submenus in zip(menus, submenus_by_menu)
+            for submenu in submenus
+        }
+
+        # dishes of submenus past the first page of their menu are left cold
+        dishes = [
+            (menu_ids[uuid.UUID(dish['submenu_id'])], uuid.UUID(dish['submenu_id']), uuid.UUID(dish['id']))
+            for dish in dishes
+            if uuid.UUID(dish['submenu_id']) in menu_ids
+        ]
+
+        await asyncio.gather(
+            *[warm_submenu(new_session, semaphore, menu_id, submenu_id) for submenu_id, menu_id in menu_ids.items()],
+            *[warm_dish(new_session, semaphore, *ids) for ids in dishes],
+        )
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        'cache warm-up took %.3fs: %d menus, %d submenus, %d dishes',
+        elapsed, len(menus), len(menu_ids), len(dishes),
+    )
+
+    return elapsed
@@ -1,6 +1,21 @@
-from sqlalchemy import insert, select
+import uuid
+from typing import Any, Iterable
+
+from sqlalchemy import (
+    ColumnElement,
+    Numeric,
+    Select,
+    String,
+    bindparam,
+    cast,
+    func,
+    insert,
+    select,
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.crud import delete_rows, upsert_rows
 from src.core.models import Dish, SubMenu
 from src.dish.schemas import DishCreate, DishRead, DishUpdatePartial
 
@@ -16,24 +31,61 @@ async def create_dish(
     return result.scalars().first()
 
 
-async def get_dish_by_title(session: AsyncSession, dish_title: str) -> Dish:
-    query = select(Dish).where(Dish.title == dish_title)
+async def get_dish_by_id(session: AsyncSession, dish_id: str) -> Dish:
+    query = select(Dish).where(Dish.id == dish_id)
     result = await session.execute(query)
     return result.scalars().first()
 
 
-async def get_dish_by_id(session: AsyncSession, dish_id: str) -> Dish:
-    query = select(Dish).where(Dish.id == dish_id)
+def discounted_price(discounts: dict[str, float] | None) -> ColumnElement:
+    if not discounts:
+        return Dish.price
+
+    discount = func.coalesce(
+        cast(bindparam('discounts', discounts, type_=JSONB).op('->>')(cast(Dish.id, String)), Numeric),
+        0,
+    )
+
+    return func.round(Dish.price * (100 - discount) / 100, 2)
+
+
+def select_dishes(discounts: dict[str, float] | None) -> Select:
+    return select(
+        Dish.id,
+        Dish.title,
+        Dish.description,
+        discounted_price(discounts).label('price'),
+        Dish.submenu_id,
+    )
+
+
+async def get_dish_with_discount(
+    session: AsyncSession,
+    dish_id: uuid.UUID | str,
+    discounts: dict[str, float] | None = None,
+) -> dict | None:
+    query = (
+        select_dishes(discounts)
+        .add_columns(SubMenu.menu_id)
+        .join(SubMenu, SubMenu.id == Dish.submenu_id)
+        .where(Dish.id == dish_id)
+    )
     result = await session.execute(query)
-    return result.scalars().first()
+    dish = result.mappings().first()
+    return dict(dish) if dish else None
 
 
 async def get_dishes(
-    session: AsyncSession, offset: int = 0, limit: int = 100
-) -> list[Dish]:
-    query = select(Dish).offset(offset).limit(limit)
+    session: AsyncSession,
+    offset: int = 0,
+    limit: int = 100,
+    after: uuid.UUID | None = None,
+    discounts: dict[str, float] | None = None,
+) -> list[dict]:
+    query = select_dishes(discounts).order_by(Dish.id).limit(limit)
+    query = query.where(Dish.id > after) if after else query.offset(offset)
     result = await session.execute(query)
-    return result.scalars().all()
+    return [dict(dish) for dish in result.mappings()]
 
 
 async def update_dish_partial(
@@ -56,3 +108,19 @@ async def delete_dish(
     await session.commit()
 
     return {'status': True, 'message': 'The dish has been deleted'}
+
+
+async def upsert_dishes(
+    session: AsyncSession,
+    dishes: list[dict[str, Any]],
+    commit: bool = True,
+) -> list[Dish]:
+    return await upsert_rows(session, Dish, dishes, commit)
+
+
+async def delete_dishes(
+    session: AsyncSession,
+    dish_ids: Iterable[uuid.UUID | str],
+    commit: bool = True,
+) -> int:
+    return await delete_rows(session, Dish, dish_ids, commit)
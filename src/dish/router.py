@@ -1,22 +1,27 @@
-from fastapi import APIRouter, BackgroundTasks, Depends, status
+from typing import Annotated
+
+from fastapi import APIRouter, BackgroundTasks, Depends, Path, Request, Response, status
+from pydantic import UUID4
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.responses import JSONResponse
 
 from src.core.database import get_async_session
 from src.core.models import Dish, Menu, SubMenu
+from src.core.pagination import decode_cursor, set_next_cursor
 from src.core.schemas import ErrorResponse, SuccessResponse
-from src.core.services import create_background_task
+from src.core.services import (
+    conflict_on_integrity_error,
+    create_background_task,
+    json_response,
+)
 from src.dish import crud
 from src.dish.schemas import DishCreate, DishRead, DishUpdatePartial
-from src.dish.services import (
-    check_unique_dish,
-    clear_dish_cache,
-    dish_by_id,
-    load_all_dishes,
-)
+from src.dish.services import dish_by_id, get_dish_cache, load_all_dishes, load_dish
 from src.menu.services import clear_menu_cache, menu_by_id
+from src.redis.keys import CATALOG, submenu_scope
 from src.redis.utils import redis
-from src.submenu.services import clear_submenu_cache, submenu_by_id
+from src.submenu.crud import get_submenu_by_id
+from src.submenu.services import submenu_by_id
 
 router = APIRouter(
     tags=['Dish'], prefix='/menus/{menu_id}/submenus/{submenu_id}/dishes'
@@ -50,13 +55,11 @@ async def create_dish(
     :param session:
     :return: new_dish
     """
-    await check_unique_dish(session, dish.title)
-
-    await create_background_task(background_tasks, redis.clear_cache, 'all_dishes')
-    await create_background_task(background_tasks, clear_menu_cache, menu.id)
-    await create_background_task(background_tasks, clear_submenu_cache, menu.id, submenu.id)
+    # the path may name another menu, the counters to refresh are those of the real one
+    await create_background_task(background_tasks, clear_menu_cache, submenu.menu_id)
 
-    new_dish = await crud.create_dish(session, dish, submenu)
+    async with conflict_on_integrity_error(session, 'dish cannot be in 2 submenus at the same time'):
+        new_dish = await crud.create_dish(session, dish, submenu)
 
     return new_dish
 
@@ -68,18 +71,23 @@ async def create_dish(
     summary='Получить все блюда'
 )
 async def get_dishes(
+    response: Response,
     session: AsyncSession = Depends(get_async_session),
     offset: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
 ) -> list[DishRead]:
     """
     \f
     :param session:
     :param offset:
     :param limit:
+    :param cursor:
     :return: dishes
     """
-    dishes = await load_all_dishes(session, offset, limit)
+    dishes = await load_all_dishes(session, offset, limit, decode_cursor(cursor))
+
+    set_next_cursor(response, dishes, limit)
 
     return dishes
 
@@ -97,9 +105,12 @@ async def get_dishes(
     }
 )
 async def get_dish(
+    menu_id: Annotated[UUID4, Path],
+    submenu_id: Annotated[UUID4, Path],
+    dish_id: Annotated[UUID4, Path],
+    request: Request,
     session: AsyncSession = Depends(get_async_session),
-    dish: Dish = Depends(dish_by_id),
-) -> DishRead:
+) -> Response:
     """
     \f
     :param menu_id:
@@ -108,7 +119,14 @@ async def get_dish(
     :param session:
     :return: dish
     """
-    return dish
+    cache_key, cache = await get_dish_cache(menu_id, submenu_id, dish_id)
+
+    if cache:
+        return json_response(cache.value, request, cache.etag)
+
+    dish = await load_dish(session, dish_id, menu_id, submenu_id, cache_key)
+
+    return json_response(DishRead.model_validate(dish).model_dump_json(), request)
 
 
 @router.patch(
@@ -120,6 +138,10 @@ async def get_dish(
         404: {
             'description': 'dish not found',
             'model': ErrorResponse
+        },
+        409: {
+            'description': 'dish cannot be in 2 submenus at the same time',
+            'model': ErrorResponse
         }
     }
 )
@@ -138,17 +160,12 @@ async def update_dish(
     :param session:
     :return: dish
     """
-    await create_background_task(
-        background_tasks,
-        redis.clear_cache,
-        f'{dish.submenu_id}_dish_{dish.id}',
-        'all_dishes',
-        'all_menus_nested'
-    )
+    await create_background_task(background_tasks, redis.invalidate, CATALOG, submenu_scope(dish.submenu_id))
 
-    return await crud.update_dish_partial(
-        session=session, dish=dish, dish_update=dish_update
-    )
+    async with conflict_on_integrity_error(session, 'dish cannot be in 2 submenus at the same time'):
+        return await crud.update_dish_partial(
+            session=session, dish=dish, dish_update=dish_update
+        )
 
 
 @router.delete(
@@ -178,6 +195,8 @@ async def delete_dish(
     :param session:
     :return: result
     """
-    await create_background_task(background_tasks, clear_dish_cache, dish.submenu_id, dish.id)
+    # the path may name other parents, the counters to refresh are those of the real menu
+    submenu = await get_submenu_by_id(session, dish.submenu_id)
+    await create_background_task(background_tasks, clear_menu_cache, submenu.menu_id)
 
     return await crud.delete_dish(session, dish)
@@ -1,3 +1,4 @@
+from decimal import Decimal
 from typing import Annotated
 
 from pydantic import UUID4, BaseModel, Field, validator
@@ -6,11 +7,11 @@ from pydantic import UUID4, BaseModel, Field, validator
 class DishBase(BaseModel):
     title: str
     description: Annotated[str | None, Field(default=None, max_length=256)]
-    price: Annotated[str | None, Field(default=0)]
+    price: Annotated[Decimal | None, Field(default=0)]
 
     @validator('price')
     def check_price_format(cls, value):
-        return str(round(float(value), 2))
+        return round(value, 2) if value is not None else value
 
 
 class DishCreate(DishBase):
@@ -24,4 +25,8 @@ class DishRead(DishBase):
 class DishUpdatePartial(BaseModel):
     title: str | None = None
     description: Annotated[str | None, Field(default=None, max_length=256)]
-    price: Annotated[str | None, Field(default=0)]
+    price: Annotated[Decimal | None, Field(default=0)]
+
+    @validator('price')
+    def check_price_format(cls, value):
+        return round(value, 2) if value is not None else value
@@ -1,6 +1,8 @@
-import json
+import uuid
+from functools import partial
 from typing import Annotated
 
+import orjson
 from fastapi import Depends, HTTPException, Path, Request, status
 from fastapi.encoders import jsonable_encoder
 from pydantic import UUID4
@@ -8,98 +10,186 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.database import get_async_session
 from src.core.models import Dish
+from src.core.services import in_new_session
 from src.dish import crud
-from src.dish.crud import get_dish_by_id, get_dish_by_title
+from src.dish.crud import get_dish_by_id, get_dish_with_discount
 from src.dish.schemas import DishRead
+from src.redis.codec import CacheEntry
+from src.redis.keys import (
+    CATALOG,
+    DISCOUNTS,
+    DISCOUNTS_KEY,
+    DISHES_LIST,
+    CacheKey,
+    dish_key,
+    menu_scope,
+    page_key,
+    submenu_scope,
+)
 from src.redis.utils import redis
 
 r = redis.get_redis_client()
 
 
+async def fetch_dish(
+    session: AsyncSession,
+    dish_id: UUID4,
+    menu_id: UUID4 | None = None,
+    submenu_id: UUID4 | None = None,
+    cache_key: CacheKey | None = None,
+) -> Dish | dict:
+    if not cache_key:
+        dish = await get_dish_by_id(session, dish_id)
+
+        if not dish:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail='dish not found'
+            )
+
+        return dish
+
+    row = await get_dish_with_discount(session, dish_id, await get_discounts())
+
+    if not row:
+        # a soft invalidated entry of a deleted dish must not be served on
+        await redis.clear_cache(cache_key)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail='dish not found'
+        )
+
+    # the key carries the generations of the parents from the path, only cache under the real ones
+    if (row['menu_id'], row['submenu_id']) == (menu_id, submenu_id):
+        await redis.setex(cache_key, 600, DishRead.model_validate(row).model_dump_json())
+    else:
+        await redis.clear_cache(cache_key)
+
+    return row
+
+
+async def get_dish_cache(menu_id: UUID4, submenu_id: UUID4, dish_id: UUID4) -> tuple[CacheKey, CacheEntry | None]:
+    cache_key = await redis.versioned_key(
+        dish_key(dish_id), menu_scope(menu_id), submenu_scope(submenu_id), DISCOUNTS
+    )
+    refresh = partial(
+        in_new_session,
+        partial(fetch_dish, dish_id=dish_id, menu_id=menu_id, submenu_id=submenu_id, cache_key=cache_key),
+    )
+
+    return cache_key, await redis.get_entry(cache_key, refresh)
+
+
+async def load_dish(
+    session: AsyncSession,
+    dish_id: UUID4,
+    menu_id: UUID4 | None = None,
+    submenu_id: UUID4 | None = None,
+    cache_key: CacheKey | None = None,
+) -> Dish | DishRead | dict:
+    if not cache_key:
+        return await fetch_dish(session, dish_id)
+
+    return await redis.coalesce(
+        cache_key,
+        partial(fetch_dish, session, dish_id, menu_id, submenu_id, cache_key),
+        DishRead.model_validate_json,
+    )
+
+
 async def dish_by_id(
+    menu_id: Annotated[UUID4, Path],
+    submenu_id: Annotated[UUID4, Path],
     dish_id: Annotated[UUID4, Path],
     request: Request,
     session: AsyncSession = Depends(get_async_session),
-) -> Dish:
+) -> Dish | DishRead | dict:
+    if request.method != 'GET':
+        return await load_dish(session, dish_id)
 
-    dish_key = r.keys(f'*_dish_{dish_id}')
+    cache_key, cache = await get_dish_cache(menu_id, submenu_id, dish_id)
 
-    cache = r.get(dish_key[0]) if dish_key else None
+    if cache:
+        return DishRead.model_validate_json(cache.value)
 
-    if cache and request.method == 'GET':
-        return DishRead(**json.loads(cache))
+    return await load_dish(session, dish_id, menu_id, submenu_id, cache_key)
 
-    dish = await get_dish_by_id(session, dish_id)
 
-    if not dish:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail='dish not found'
-        )
-
-    if request.method == 'GET':
-        r.setex(
-            f'{dish.submenu_id}_dish_{dish.id}', 600, json.dumps(jsonable_encoder(dish))
-        )
+async def fetch_dishes_page(
+    session: AsyncSession,
+    list_key: CacheKey,
+    cache_key: CacheKey,
+    offset: int,
+    limit: int,
+    after: uuid.UUID | None = None,
+) -> list[dict]:
+    dishes = await crud.get_dishes(session, offset, limit, after, await get_discounts())
 
-    dish.price = await get_new_dish_price(dish)
+    await redis.setex_page(list_key, cache_key, 3600, orjson.dumps(jsonable_encoder(dishes)))
 
-    return dish
+    return dishes
 
 
-async def check_unique_dish(
+async def load_all_dishes(
     session: AsyncSession,
-    dish_title: Annotated[str, Path],
-) -> None:
-    result = await get_dish_by_title(session, dish_title)
+    offset: int,
+    limit: int,
+    after: uuid.UUID | None = None,
+) -> list[dict]:
+    list_key = await redis.versioned_key(DISHES_LIST, CATALOG, DISCOUNTS)
+    cache_key = page_key(list_key, offset, limit, after)
+    fetch = partial(fetch_dishes_page, list_key=list_key, cache_key=cache_key, offset=offset, limit=limit, after=after)
 
-    if result:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail='dish cannot be in 2 submenus at the same time',
-        )
+    cache = await redis.get(cache_key, partial(in_new_session, fetch))
 
+    if cache:
+        return orjson.loads(cache)
 
-def clear_dish_cache(submenu_id: str, dish_id: str) -> None:
-    redis.clear_main_cache()
+    return await redis.coalesce(cache_key, partial(fetch, session), orjson.loads)
 
-    menu_key = r.keys(f'*_submenu_{submenu_id}')
 
-    menu_id = menu_key[0].split('_')[0] if menu_key else None
+class DiscountsSnapshot:
+    """
+    In-process copy of the discounts hash, reloaded only when the discounts
+    generation moves.
+    """
 
-    redis.clear_cache(
-        f'{submenu_id}_dish_{dish_id}',
-        f'{submenu_id}_dish_{dish_id}',
-        f'{menu_id}_submenu_{submenu_id}',
-    )
+    def __init__(self) -> None:
+        self.version: list[tuple[int, int]] | None = None
+        self.discounts: dict[str, float] = {}
 
+    async def get(self) -> dict[str, float]:
+        version = await redis.generations(DISCOUNTS)
 
-async def load_all_dishes(session: AsyncSession, offset: int, limit: int) -> list[Dish]:
-    cache = r.get('all_dishes')
-    params = r.get('dishes_params')
+        if version != self.version:
+            discounts = await r.hgetall(DISCOUNTS_KEY)
+            self.discounts = {dish_id: float(discount) for dish_id, discount in discounts.items()}
+            self.version = version
 
-    if cache and params == f'{offset}_{limit}':
-        return json.loads(cache)
+        return self.discounts
 
-    dishes = await crud.get_dishes(session, offset, limit)
 
-    for dish in dishes:
-        dish.price = await get_new_dish_price(dish)
+discounts_snapshot = DiscountsSnapshot()
 
-    r.setex('all_dishes', 3600, json.dumps(jsonable_encoder(dishes)))
-    r.setex('dishes_params', 3600, f'{offset}_{limit}')
 
-    return dishes
+async def get_discounts() -> dict[str, float]:
+    return await discounts_snapshot.get()
+
 
+async def set_discounts(discounts: dict[str, float]) -> bool:
+    """
+    Replaces the discounts hash, returns whether anything changed.
+    """
+    new_discounts = {str(dish_id): str(discount) for dish_id, discount in discounts.items() if discount}
 
-async def get_new_dish_price(dish: Dish) -> str:
-    discounts = r.get('discounts')
-    dish_id = str(dish.id)
+    if await r.hgetall(DISCOUNTS_KEY) == new_discounts:
+        return False
 
-    if discounts:
-        discounts = json.loads(discounts)
-        if dish_id in discounts:
-            discount = discounts[dish_id]
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.delete(DISCOUNTS_KEY)
+        if new_discounts:
+            pipe.hset(DISCOUNTS_KEY, mapping=new_discounts)
+        await pipe.execute()
 
-            return str(float(dish.price) - float(dish.price) * (discount / 100))
+    # prices change, serve the old ones until they are recomputed
+    await redis.invalidate(DISCOUNTS, soft=True)
 
-    return dish.price
+    return True
@@ -1,6 +1,11 @@
-from sqlalchemy import insert, select
+import uuid
+from typing import Any, AsyncIterator, Iterable
+
+from sqlalchemy import bindparam, insert, select, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.crud import delete_rows, upsert_rows
 from src.core.models import Menu
 from src.menu.schemas import MenuCreate, MenuRead, MenuUpdatePartial
 
@@ -12,21 +17,68 @@ async def create_menu(session: AsyncSession, menu: MenuCreate) -> MenuRead:
     return result.scalars().first()
 
 
+# key order follows MenuReadNested / SubMenuReadNested / DishRead
+MENU_JSON = '''
+json_build_object(
+    'title', m.title,
+    'description', m.description,
+    'id', m.id,
+    'submenus', coalesce((
+        SELECT json_agg(json_build_object(
+            'title', s.title,
+            'description', s.description,
+            'id', s.id,
+            'dishes', coalesce((
+                SELECT json_agg(json_build_object(
+                    'title', d.title,
+                    'description', d.description,
+                    'price', round(
+                        d.price * (100 - coalesce((CAST(:discounts AS jsonb) ->> d.id::text)::numeric, 0)) / 100, 2
+                    )::text,
+                    'id', d.id
+                ) ORDER BY d.id)
+                FROM dish d
+                WHERE d.submenu_id = s.id
+            ), '[]'::json)
+        ) ORDER BY s.id)
+        FROM submenu s
+        WHERE s.menu_id = m.id
+    ), '[]'::json)
+)
+'''
+
+NESTED_MENUS_QUERY = text(
+    f'''
+    SELECT coalesce(json_agg(menus.menu_json ORDER BY menus.id), '[]'::json)::text
+    FROM (
+        SELECT m.id, {MENU_JSON} AS menu_json
+        FROM menu m
+        ORDER BY m.id
+        OFFSET :offset
+        LIMIT :limit
+    ) menus
+    '''
+).bindparams(bindparam('discounts', type_=JSONB))
+
+MENUS_STREAM_QUERY = text(
+    f'''
+    SELECT {MENU_JSON}::text
+    FROM menu m
+    ORDER BY m.id
+    '''
+).bindparams(bindparam('discounts', type_=JSONB))
+
+
 async def get_menus(
-    session: AsyncSession, offset: int = 0, limit: int = 100
+    session: AsyncSession,
+    offset: int = 0,
+    limit: int = 100,
+    after: uuid.UUID | None = None,
 ) -> list[MenuRead]:
-    query = select(Menu).offset(offset).limit(limit)
+    query = select(Menu).order_by(Menu.id).limit(limit)
+    query = query.where(Menu.id > after) if after else query.offset(offset)
     result = await session.execute(query)
-    menus = result.scalars().all()
-
-    from src.menu.services import get_submenus_dishes
-
-    for menu in menus:
-        submenus_dishes = await get_submenus_dishes(session, menu.id)
-        menu.submenus_count = submenus_dishes.total_submenus
-        menu.dishes_count = submenus_dishes.total_dishes
-
-    return menus
+    return result.scalars().all()
 
 
 async def get_menu_by_id(session: AsyncSession, menu_id: str) -> Menu | None:
@@ -57,10 +109,41 @@ async def delete_menu(
     return {'status': True, 'message': 'The menu has been deleted'}
 
 
-async def get_menu_by_title(
+async def get_menus_nested_json(
     session: AsyncSession,
-    menu_title: str,
-) -> Menu | None:
-    query = select(Menu).where(Menu.title == menu_title)
-    result = await session.execute(query)
-    return result.scalars().first()
+    offset: int = 0,
+    limit: int = 100,
+    discounts: dict[str, float] | None = None,
+) -> str:
+    result = await session.execute(
+        NESTED_MENUS_QUERY, {'offset': offset, 'limit': limit, 'discounts': discounts or {}}
+    )
+    return result.scalar_one()
+
+
+async def stream_menus_nested_json(
+    session: AsyncSession,
+    batch_size: int = 100,
+    discounts: dict[str, float] | None = None,
+) -> AsyncIterator[str]:
+    result = await session.stream(
+        MENUS_STREAM_QUERY, {'discounts': discounts or {}}, execution_options={'yield_per': batch_size}
+    )
+    async for menu_json in result.scalars():
+        yield menu_json
+
+
+async def upsert_menus(
+    session: AsyncSession,
+    menus: list[dict[str, Any]],
+    commit: bool = True,
+) -> list[Menu]:
+    return await upsert_rows(session, Menu, menus, commit)
+
+
+async def delete_menus(
+    session: AsyncSession,
+    menu_ids: Iterable[uuid.UUID | str],
+    commit: bool = True,
+) -> int:
+    return await delete_rows(session, Menu, menu_ids, commit)
@@ -1,20 +1,31 @@
-from fastapi import APIRouter, BackgroundTasks, Depends, status
+from typing import Annotated
+
+from fastapi import APIRouter, BackgroundTasks, Depends, Path, Request, Response, status
+from pydantic import UUID4
 from sqlalchemy.ext.asyncio import AsyncSession
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, StreamingResponse
 
 from src.core.database import get_async_session
 from src.core.models import Menu
+from src.core.pagination import decode_cursor, set_next_cursor
 from src.core.schemas import ErrorResponse, SuccessResponse
-from src.core.services import create_background_task
+from src.core.services import (
+    conflict_on_integrity_error,
+    create_background_task,
+    json_response,
+)
 from src.menu import crud
 from src.menu.schemas import MenuCreate, MenuRead, MenuReadNested, MenuUpdatePartial
 from src.menu.services import (
-    check_unique_menu,
     clear_menu_cache,
+    get_menu_cache,
     load_all_menus,
     load_all_menus_nested,
+    load_menu,
     menu_by_id,
+    stream_menus_nested,
 )
+from src.redis.keys import CATALOG
 from src.redis.utils import redis
 
 router = APIRouter(tags=['Menu'], prefix='/menus')
@@ -25,6 +36,12 @@ router = APIRouter(tags=['Menu'], prefix='/menus')
     response_model=MenuRead,
     status_code=status.HTTP_201_CREATED,
     summary='Создать меню',
+    responses={
+        409: {
+            'description': 'menu with that title already exists',
+            'model': ErrorResponse
+        }
+    }
 )
 async def create_menu(
     menu: MenuCreate,
@@ -37,11 +54,10 @@ async def create_menu(
     :param session:
     :return: new_menu
     """
-    await check_unique_menu(menu.title, session)
-
-    await create_background_task(background_tasks, redis.clear_cache, 'all_menus', 'all_menus_nested')
+    await create_background_task(background_tasks, redis.invalidate, CATALOG)
 
-    new_menu = await crud.create_menu(session, menu)
+    async with conflict_on_integrity_error(session, 'menu with that title already exists'):
+        new_menu = await crud.create_menu(session, menu)
 
     return new_menu
 
@@ -53,19 +69,24 @@ async def create_menu(
     summary='Получить все меню',
 )
 async def get_menus(
+    response: Response,
     session: AsyncSession = Depends(get_async_session),
     offset: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
 ) -> list[MenuRead]:
     """
     \f
     :param session:
     :param offset:
     :param limit:
+    :param cursor:
     :return: menus
     """
 
-    menus = await load_all_menus(session, offset, limit)
+    menus = await load_all_menus(session, offset, limit, decode_cursor(cursor))
+
+    set_next_cursor(response, menus, limit)
 
     return menus
 
@@ -77,10 +98,11 @@ async def get_menus(
     summary='Получить все меню со всеми подменю и блюдами',
 )
 async def get_menus_nested(
+    request: Request,
     session: AsyncSession = Depends(get_async_session),
     offset: int = 0,
     limit: int = 100,
-) -> list[MenuReadNested]:
+) -> Response:
     """
     \f
     :param session:
@@ -89,9 +111,25 @@ async def get_menus_nested(
     :return: menus
     """
 
-    menus_nested = await load_all_menus_nested(session, offset, limit)
+    menus_nested, etag = await load_all_menus_nested(session, offset, limit)
 
-    return menus_nested
+    # the document is built by postgres already, skip response_model validation
+    return json_response(menus_nested, request, etag)
+
+
+@router.get(
+    '/nested/stream',
+    response_class=StreamingResponse,
+    status_code=status.HTTP_200_OK,
+    summary='Получить все меню со всеми подменю и блюдами потоком (NDJSON)',
+)
+async def get_menus_nested_stream() -> StreamingResponse:
+    """
+    \f
+    :return: one menu per line
+    """
+
+    return StreamingResponse(stream_menus_nested(), media_type='application/x-ndjson')
 
 
 @router.get(
@@ -105,14 +143,25 @@ async def get_menus_nested(
         }
     }
 )
-async def get_menu(menu: Menu = Depends(menu_by_id)) -> MenuRead:
+async def get_menu(
+    menu_id: Annotated[UUID4, Path],
+    request: Request,
+    session: AsyncSession = Depends(get_async_session),
+) -> Response:
     """
     \f
     :param menu_id:
+    :param session:
     :return: menu
     """
+    cache_key, cache = await get_menu_cache(menu_id)
 
-    return menu
+    if cache:
+        return json_response(cache.value, request, cache.etag)
+
+    menu = await load_menu(session, menu_id, cache_key)
+
+    return json_response(MenuRead.model_validate(menu, from_attributes=True).model_dump_json(), request)
 
 
 @router.patch(
@@ -124,6 +173,10 @@ async def get_menu(menu: Menu = Depends(menu_by_id)) -> MenuRead:
         404: {
             'description': 'menu not found',
             'model': ErrorResponse
+        },
+        409: {
+            'description': 'menu with that title already exists',
+            'model': ErrorResponse
         }
     }
 )
@@ -140,17 +193,12 @@ async def update_menu(
     :param session:
     :return: menu
     """
-    await create_background_task(
-        background_tasks,
-        redis.clear_cache,
-        f'menu_{menu.id}',
-        'all_menus',
-        'all_menus_nested'
-    )
-
-    return await crud.update_menu_partial(
-        session=session, menu=menu, menu_update=menu_update
-    )
+    await create_background_task(background_tasks, clear_menu_cache, menu.id)
+
+    async with conflict_on_integrity_error(session, 'menu with that title already exists'):
+        return await crud.update_menu_partial(
+            session=session, menu=menu, menu_update=menu_update
+        )
 
 
 @router.delete(
@@ -1,142 +1,152 @@
-import json
-from typing import Annotated
+import uuid
+from functools import partial
+from typing import Annotated, AsyncIterator
 
+import orjson
 from fastapi import Depends, HTTPException, Path, Request, status
 from fastapi.encoders import jsonable_encoder
 from pydantic import UUID4
-from sqlalchemy import func, select
-from sqlalchemy.engine.row import Row
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
-from src.core.database import get_async_session
-from src.core.models import Dish, Menu, SubMenu
+from src.core.database import get_async_context, get_async_session
+from src.core.models import Menu
+from src.core.services import in_new_session
+from src.dish.services import get_discounts
 from src.menu import crud
-from src.menu.crud import get_menu_by_id, get_menu_by_title
-from src.menu.schemas import MenuRead, MenuReadNested
+from src.menu.crud import get_menu_by_id
+from src.menu.schemas import MenuRead
+from src.redis.codec import CacheEntry
+from src.redis.keys import (
+    CATALOG,
+    DISCOUNTS,
+    MENUS_LIST,
+    MENUS_NESTED_LIST,
+    CacheKey,
+    menu_key,
+    menu_scope,
+    page_key,
+)
 from src.redis.utils import redis
 
-r = redis.get_redis_client()
-
-
-async def menu_by_id(
-    menu_id: Annotated[UUID4, Path],
-    request: Request,
-    session: AsyncSession = Depends(get_async_session),
-) -> Menu:
-    cache = r.get(f'menu_{menu_id}')
-
-    if cache and request.method == 'GET':
-        return MenuRead(**json.loads(cache))
 
+async def fetch_menu(session: AsyncSession, menu_id: UUID4, cache_key: CacheKey | None = None) -> Menu:
     menu = await get_menu_by_id(session, menu_id)
 
     if not menu:
+        if cache_key:
+            # a soft invalidated entry of a deleted menu must not be served on
+            await redis.clear_cache(cache_key)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail='menu not found'
         )
 
-    submenus_dishes = await get_submenus_dishes(session, menu.id)
-
-    menu.submenus_count = submenus_dishes.total_submenus
-    menu.dishes_count = submenus_dishes.total_dishes
-
-    if request.method == 'GET':
-        r.setex(f'menu_{menu.id}', 600, json.dumps(jsonable_encoder(menu)))
+    if cache_key:
+        await redis.setex(cache_key, 600, MenuRead.model_validate(menu, from_attributes=True).model_dump_json())
 
     return menu
 
 
-async def check_unique_menu(
-    menu_title: Annotated[str, Path],
-    session: AsyncSession,
-) -> None:
-    result = await get_menu_by_title(session, menu_title)
+async def get_menu_cache(menu_id: UUID4) -> tuple[CacheKey, CacheEntry | None]:
+    cache_key = await redis.versioned_key(menu_key(menu_id), menu_scope(menu_id))
+    refresh = partial(in_new_session, partial(fetch_menu, menu_id=menu_id, cache_key=cache_key))
 
-    if result:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail='menu with that title already exists',
-        )
+    return cache_key, await redis.get_entry(cache_key, refresh)
 
 
-async def get_submenus_dishes(
-    session: AsyncSession,
-    menu_id: Annotated[str, Path],
-) -> Row:
-    query = (
-        select(
-            func.count(func.distinct(SubMenu.id)).label('total_submenus'),
-            func.count(func.distinct(Dish.id)).label('total_dishes'),
-        )
-        .select_from(Menu)
-        .outerjoin(SubMenu, Menu.id == SubMenu.menu_id)
-        .outerjoin(Dish, SubMenu.id == Dish.submenu_id)
-        .where(Menu.id == menu_id)
-        .group_by(Menu.id, Menu.title)
+async def load_menu(session: AsyncSession, menu_id: UUID4, cache_key: CacheKey | None = None) -> Menu | MenuRead:
+    if not cache_key:
+        return await fetch_menu(session, menu_id)
+
+    return await redis.coalesce(
+        cache_key,
+        partial(fetch_menu, session, menu_id, cache_key),
+        MenuRead.model_validate_json,
     )
 
-    result = await session.execute(query)
 
-    row = result.fetchone()
+async def menu_by_id(
+    menu_id: Annotated[UUID4, Path],
+    request: Request,
+    session: AsyncSession = Depends(get_async_session),
+) -> Menu:
+    if request.method != 'GET':
+        return await load_menu(session, menu_id)
 
-    return row
+    cache_key, cache = await get_menu_cache(menu_id)
 
+    if cache:
+        return MenuRead.model_validate_json(cache.value)
 
-def clear_menu_cache(menu_id: str) -> None:
-    redis.clear_main_cache()
+    return await load_menu(session, menu_id, cache_key)
 
-    redis.clear_cache(f'menu_{menu_id}')
 
-    submenu_keys = r.keys(f'{menu_id}*')
+async def clear_menu_cache(menu_id: UUID4, soft: bool = False) -> None:
+    # everything cached under the menu (its submenus and dishes too) becomes unreachable or stale
+    await redis.invalidate(CATALOG, menu_scope(menu_id), soft=soft)
 
-    # clear all submenus for target menu
-    submenus = []
-    for key in submenu_keys:
-        r.delete(key)
-        submenus.append(f"{key.split('_')[-1]}*")
 
-    # find all dishes for all submenus
-    dish_keys = []
-    for submenu in submenus:
-        dish_keys.extend(r.keys(submenu))
+async def fetch_menus_page(
+    session: AsyncSession,
+    list_key: CacheKey,
+    cache_key: CacheKey,
+    offset: int,
+    limit: int,
+    after: uuid.UUID | None = None,
+) -> list[Menu]:
+    menus = await crud.get_menus(session, offset, limit, after)
 
-    # clear all dishes
-    if dish_keys:
-        redis.clear_cache(dish_keys)
+    await redis.setex_page(list_key, cache_key, 3600, orjson.dumps(jsonable_encoder(menus)))
 
+    return menus
 
-async def load_all_menus(session: AsyncSession, offset: int, limit: int) -> list[Menu]:
-    cache = r.get('all_menus')
-    params = r.get('menus_params')
 
-    if cache and params == f'{offset}_{limit}':
-        return json.loads(cache)
+async def load_all_menus(
+    session: AsyncSession,
+    offset: int,
+    limit: int,
+    after: uuid.UUID | None = None,
+) -> list[Menu]:
+    list_key = await redis.versioned_key(MENUS_LIST, CATALOG)
+    cache_key = page_key(list_key, offset, limit, after)
+    fetch = partial(fetch_menus_page, list_key=list_key, cache_key=cache_key, offset=offset, limit=limit, after=after)
 
-    menus = await crud.get_menus(session, offset, limit)
+    cache = await redis.get(cache_key, partial(in_new_session, fetch))
 
-    r.setex('all_menus', 3600, json.dumps(jsonable_encoder(menus)))
-    r.setex('menus_params', 3600, f'{offset}_{limit}')
+    if cache:
+        return orjson.loads(cache)
 
-    return menus
+    return await redis.coalesce(cache_key, partial(fetch, session), orjson.loads)
 
 
-async def load_all_menus_nested(session: AsyncSession, offset: int, limit: int) -> list[MenuReadNested]:
-    cache = r.get('all_menus_nested')
-    params = r.get('menus_nested_params')
+async def fetch_menus_nested_page(
+    session: AsyncSession,
+    list_key: CacheKey,
+    cache_key: CacheKey,
+    offset: int,
+    limit: int,
+) -> str:
+    nested_menus = await crud.get_menus_nested_json(session, offset, limit, await get_discounts())
 
-    if cache and params == f'{offset}_{limit}':
-        return json.loads(cache)
+    await redis.setex_page(list_key, cache_key, 6000, nested_menus)
 
-    query = select(Menu).options(
-        selectinload(Menu.submenus).selectinload(SubMenu.dishes)
-    ).offset(offset).limit(limit)
+    return nested_menus
 
-    result = await session.execute(query)
 
-    nested_menus = result.scalars().all()
+async def load_all_menus_nested(session: AsyncSession, offset: int, limit: int) -> tuple[str | bytes, str | None]:
+    list_key = await redis.versioned_key(MENUS_NESTED_LIST, CATALOG, DISCOUNTS)
+    cache_key = page_key(list_key, offset, limit)
+    fetch = partial(fetch_menus_nested_page, list_key=list_key, cache_key=cache_key, offset=offset, limit=limit)
 
-    r.setex('all_menus_nested', 6000, json.dumps(jsonable_encoder(nested_menus)))
-    r.setex('menus_nested_params', 3600, f'{offset}_{limit}')
+    cache = await redis.get_entry(cache_key, partial(in_new_session, fetch))
 
-    return nested_menus
+    if cache:
+        return cache.value, cache.etag
+
+    return await redis.coalesce(cache_key, partial(fetch, session), bytes), None
+
+
+async def stream_menus_nested() -> AsyncIterator[str]:
+    # the request session is closed before the body is sent, so the stream owns its own one
+    async with get_async_context() as session:
+        async for menu_json in crud.stream_menus_nested_json(session, discounts=await get_discounts()):
+            yield menu_json + '\n'
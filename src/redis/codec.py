@@ -0,0 +1,67 @@
+"""
+Binary framing of cache entries.
+
+    <flags: 1 byte><fresh_until>|<tag>|<etag>|<payload>
+
+The payload is the serialized response body (json), compressed when it is
+larger than cache_compress_min_bytes. The etag is computed once, on write.
+"""
+import hashlib
+import time
+import zlib
+from typing import NamedTuple
+
+from src.core.config import settings
+
+RAW = 0
+ZLIB = 1
+
+
+class CacheEntry(NamedTuple):
+    fresh_until: float
+    tag: str
+    etag: str
+    value: bytes
+
+
+def make_etag(payload: str | bytes) -> str:
+    if isinstance(payload, str):
+        payload = payload.encode()
+
+    return f'"{hashlib.blake2b(payload, digest_size=16).hexdigest()}"'
+
+
+def compress(payload: bytes) -> tuple[int, bytes]:
+    if settings.cache_compression != 'zlib' or len(payload) < settings.cache_compress_min_bytes:
+        return RAW, payload
+
+    compressed = zlib.compress(payload, settings.cache_compress_level)
+
+    # small or already dense documents may not shrink
+    if len(compressed) >= len(payload):
+        return RAW, payload
+
+    return ZLIB, compressed
+
+
+def decompress(flags: int, payload: bytes) -> bytes:
+    if flags == ZLIB:
+        return zlib.decompress(payload)
+
+    return payload
+
+
+def encode_entry(value: str | bytes, tag: str, ttl: int) -> tuple[bytes, CacheEntry]:
+    if isinstance(value, str):
+        value = value.encode()
+
+    entry = CacheEntry(round(time.time() + min(settings.cache_soft_ttl, ttl), 3), tag, make_etag(value), value)
+    flags, payload = compress(value)
+
+    return bytes([flags]) + f'{entry.fresh_until:.3f}|{tag}|{entry.etag}|'.encode() + payload, entry
+
+
+def decode_entry(raw: bytes) -> CacheEntry:
+    fresh_until, tag, etag, payload = raw[1:].split(b'|', 3)
+
+    return CacheEntry(float(fresh_until), tag.decode(), etag.decode(), decompress(raw[0], payload))
@@ -0,0 +1,88 @@
+"""
+Cache key schema.
+
+Entity keys are derived from the entity id alone. The actual redis key is
+suffixed with the generation of every scope the value depends on, see
+CacheCleaner.versioned_key: bumping a scope generation makes all keys
+built on top of it unreachable, they are left to expire.
+
+Every scope also has a soft generation. It is not part of the key but of its
+tag: entries whose tag is behind are still served, as stale, while they are
+refreshed in the background.
+"""
+import re
+from typing import NamedTuple
+
+INVALIDATION_CHANNEL = 'cache:invalidate'
+
+# everything that lists the whole catalog: menu lists, nested tree, dish lists
+CATALOG = 'catalog'
+# everything that shows a dish price
+DISCOUNTS = 'discounts'
+
+# dish id -> discount percent
+DISCOUNTS_KEY = 'discounts:by_dish'
+
+
+def menu_scope(menu_id: object) -> str:
+    return f'menu:{menu_id}'
+
+
+def submenu_scope(submenu_id: object) -> str:
+    return f'submenu:{submenu_id}'
+
+
+class CacheKey(NamedTuple):
+    key: str
+    tag: str = ''
+
+
+def generation_key(scope: str) -> str:
+    return f'gen:{scope}'
+
+
+def soft_generation_key(scope: str) -> str:
+    return f'gen:{scope}:soft'
+
+
+def lock_key(key: str) -> str:
+    return f'lock:{key}'
+
+
+def menu_key(menu_id: object) -> str:
+    return f'menu:{menu_id}'
+
+
+def submenu_key(submenu_id: object) -> str:
+    return f'submenu:{submenu_id}'
+
+
+def dish_key(dish_id: object) -> str:
+    return f'dish:{dish_id}'
+
+
+MENUS_LIST = 'menus'
+MENUS_NESTED_LIST = 'menus:nested'
+DISHES_LIST = 'dishes'
+
+
+def menu_submenus_key(menu_id: object) -> str:
+    return f'menu:{menu_id}:submenus'
+
+
+def page_key(list_key: CacheKey, offset: int, limit: int, after: object = None) -> CacheKey:
+    return CacheKey(f"{list_key.key}:page:{offset}:{limit}:{after or ''}", list_key.tag)
+
+
+def pages_key(list_key: str) -> str:
+    return f'{list_key}:pages'
+
+
+UUID_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+
+def key_family(key: str) -> str:
+    """
+    menu:<id>@3.1 -> menu:*, menu:<id>:submenus@2:page:0:100: -> menu:*:submenus
+    """
+    return UUID_PATTERN.sub('*', key.split('@', 1)[0])
@@ -0,0 +1,57 @@
+from collections import defaultdict
+
+from src.redis.keys import key_family
+
+
+class FamilyStats:
+    def __init__(self) -> None:
+        self.local_hits = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.bytes_written = 0
+        self.payload_bytes_written = 0
+        self.max_entry_bytes = 0
+
+    def as_dict(self) -> dict[str, int | float]:
+        lookups = self.local_hits + self.hits + self.misses
+
+        return {
+            **vars(self),
+            'hit_ratio': round((self.local_hits + self.hits) / lookups, 4) if lookups else 0.0,
+            'avg_entry_bytes': self.bytes_written // self.writes if self.writes else 0,
+        }
+
+
+class CacheStats:
+    """
+    Per key family (menu:*, dish:*, menus:nested, ...) counters of this process.
+    """
+
+    def __init__(self) -> None:
+        self.families: defaultdict[str, FamilyStats] = defaultdict(FamilyStats)
+
+    def local_hit(self, key: str) -> None:
+        self.families[key_family(key)].local_hits += 1
+
+    def hit(self, key: str, stale: bool) -> None:
+        family = self.families[key_family(key)]
+        family.hits += 1
+        family.stale_hits += stale
+
+    def miss(self, key: str) -> None:
+        self.families[key_family(key)].misses += 1
+
+    def write(self, key: str, size: int, payload_size: int) -> None:
+        family = self.families[key_family(key)]
+        family.writes += 1
+        family.bytes_written += size
+        family.payload_bytes_written += payload_size
+        family.max_entry_bytes = max(family.max_entry_bytes, size)
+
+    def as_dict(self) -> dict[str, dict[str, int | float]]:
+        return {name: family.as_dict() for name, family in sorted(self.families.items())}
+
+
+cache_stats = CacheStats()
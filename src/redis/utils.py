@@ -1,21 +1,406 @@
-from redis import Redis
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterable, Iterator, TypeVar
+
+from cachetools import TTLCache
+
+from redis.asyncio import ConnectionPool, Redis
+from redis.exceptions import RedisError
+from src.core.config import settings
+from src.core.metrics import REDIS, metrics
+from src.redis.codec import CacheEntry, decode_entry, encode_entry
+from src.redis.keys import (
+    INVALIDATION_CHANNEL,
+    CacheKey,
+    generation_key,
+    lock_key,
+    pages_key,
+    soft_generation_key,
+)
+from src.redis.stats import cache_stats
+
+logger = logging.getLogger(__name__)
+
+# delete the lock only if it is still ours, it may have expired and been taken by another worker
+RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# keys per UNLINK command, keeps a single command from blocking redis for long
+CLEAR_BATCH_SIZE = 500
+
+T = TypeVar('T')
+
+# set while warming up: stale entries count as misses and are recomputed in place
+revalidate_inline: ContextVar[bool] = ContextVar('revalidate_inline', default=False)
+
+
+@contextmanager
+def revalidating_inline() -> Iterator[None]:
+    token = revalidate_inline.set(True)
+    try:
+        yield
+    finally:
+        revalidate_inline.reset(token)
+
+
+def flatten_keys(keys: Iterable[Any]) -> Iterator[str]:
+    for key in keys:
+        if isinstance(key, CacheKey):
+            yield key.key
+        elif isinstance(key, str):
+            yield key
+        elif isinstance(key, Iterable):
+            yield from flatten_keys(key)
+        else:
+            yield str(key)
 
 
 class CacheCleaner:
     def __init__(self) -> None:
-        self.redis = Redis(
-            host='redis', port=6379, decode_responses=True, encoding='utf-8'
+        self.pool = ConnectionPool(
+            host=settings.redis_host,
+            port=settings.redis_port,
+            max_connections=settings.redis_max_connections,
+            decode_responses=True,
+            encoding='utf-8',
         )
+        self.redis = Redis(connection_pool=self.pool)
+
+        # cache entries are binary frames, see src/redis/codec.py
+        self.binary_pool = ConnectionPool(
+            host=settings.redis_host,
+            port=settings.redis_port,
+            max_connections=settings.redis_max_connections,
+        )
+        self.binary = Redis(connection_pool=self.binary_pool)
+
+        # L1: a hard invalidation moves readers to another key, so local entries are never
+        # invalidated, only the generations they are built from are. A stale local entry
+        # is checked against redis before it is served. Entries are kept decoded.
+        self.local: TTLCache = TTLCache(
+            maxsize=settings.cache_local_max_bytes,
+            ttl=settings.cache_local_ttl,
+            getsizeof=lambda entry: len(entry.value),
+        )
+        self.local_generations: TTLCache = TTLCache(
+            maxsize=settings.cache_local_max_generations, ttl=settings.cache_local_generation_ttl
+        )
+        self.invalidations = 0
+        self.listener: asyncio.Task | None = None
+
+        self.flights: dict[str, asyncio.Future] = {}
+        self.refreshing: set[str] = set()
+        self.background: set[asyncio.Task] = set()
+        self.release_lock = self.redis.register_script(RELEASE_LOCK)
 
     def get_redis_client(self) -> Redis:
         return self.redis
 
-    def clear_main_cache(self) -> None:
-        self.clear_cache('all_menus', 'all_submenus', 'all_dishes', 'all_menus_nested')
+    async def connect(self) -> None:
+        await self.redis.ping()
+
+    async def close(self) -> None:
+        await self.stop_listener()
+        await self.pool.disconnect()
+        await self.binary_pool.disconnect()
+
+    @property
+    def local_enabled(self) -> bool:
+        # without a subscription nobody tells us about other processes' writes
+        return self.listener is not None and not self.listener.done()
+
+    def start_listener(self) -> None:
+        if not self.local_enabled:
+            self.listener = asyncio.create_task(self.listen())
+
+    async def stop_listener(self) -> None:
+        if self.listener is None:
+            return
+
+        self.listener.cancel()
+        try:
+            await self.listener
+        except asyncio.CancelledError:
+            pass
+
+        self.listener = None
+        self.drop_local_generations()
+
+    def drop_local_generations(self, *scopes: str) -> None:
+        self.invalidations += 1
+
+        if not scopes:
+            self.local_generations.clear()
+
+        for scope in scopes:
+            self.local_generations.pop(scope, None)
+
+    async def listen(self) -> None:
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    # anything published while we were not subscribed is lost
+                    self.drop_local_generations()
+
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self.drop_local_generations(*message['data'].split())
+            except RedisError:
+                logger.warning('cache invalidation channel lost, reconnecting', exc_info=True)
+                self.drop_local_generations()
+                await asyncio.sleep(1)
+
+    async def get(self, key: CacheKey, refresh: Callable[[], Awaitable[Any]] | None = None) -> bytes | None:
+        entry = await self.get_entry(key, refresh)
+
+        return entry.value if entry else None
+
+    async def get_entry(
+        self,
+        key: CacheKey,
+        refresh: Callable[[], Awaitable[Any]] | None = None,
+    ) -> CacheEntry | None:
+        """
+        Returns the cached entry, stale or not. A stale entry (past its soft ttl or
+        tagged with an older soft generation) triggers refresh() in the background.
+        """
+        now = time.time()
+
+        if self.local_enabled:
+            entry = self.local.get(key.key)
+
+            if entry is not None and entry.tag == key.tag and now < entry.fresh_until:
+                cache_stats.local_hit(key.key)
+                return entry
+
+        with metrics.timed(REDIS, command='get'):
+            raw = await self.binary.get(key.key)
+
+        if raw is None:
+            cache_stats.miss(key.key)
+            return None
+
+        entry = decode_entry(raw)
+        stale = entry.tag != key.tag or now >= entry.fresh_until
+
+        if stale and revalidate_inline.get():
+            cache_stats.miss(key.key)
+            return None
+
+        cache_stats.hit(key.key, stale)
+
+        if self.local_enabled:
+            self.set_local(key.key, entry)
+
+        if refresh is not None and stale:
+            self.revalidate(key, refresh)
+
+        return entry
+
+    async def setex(self, key: CacheKey, ttl: int, value: str | bytes) -> None:
+        raw = self.encode(key, ttl, value)
+
+        with metrics.timed(REDIS, command='setex'):
+            await self.binary.setex(key.key, ttl, raw)
+
+    def encode(self, key: CacheKey, ttl: int, value: str | bytes) -> bytes:
+        raw, entry = encode_entry(value, key.tag, ttl)
+
+        cache_stats.write(key.key, len(raw), len(entry.value))
+
+        if self.local_enabled:
+            self.set_local(key.key, entry)
+
+        return raw
+
+    def revalidate(self, key: CacheKey, refresh: Callable[[], Awaitable[Any]]) -> None:
+        if key.key in self.refreshing:
+            return
+
+        self.refreshing.add(key.key)
+
+        task = asyncio.create_task(self.run_refresh(key, refresh))
+        # the loop only keeps weak references to tasks
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+
+    async def run_refresh(self, key: CacheKey, refresh: Callable[[], Awaitable[Any]]) -> None:
+        token = uuid.uuid4().hex
+
+        try:
+            # another worker is already on it
+            if not await self.redis.set(lock_key(key.key), token, nx=True, px=settings.cache_lock_ttl_ms):
+                return
+
+            try:
+                await refresh()
+            finally:
+                await self.release_lock(keys=[lock_key(key.key)], args=[token])
+        except Exception:
+            logger.warning('cache refresh of %s failed', key.key, exc_info=True)
+        finally:
+            self.refreshing.discard(key.key)
+
+    def set_local(self, key: str, entry: CacheEntry) -> None:
+        try:
+            self.local[key] = entry
+        except ValueError:
+            # larger than the whole L1, redis only
+            pass
+
+    async def generations(self, *scopes: str) -> list[tuple[int, int]]:
+        if self.local_enabled:
+            local = [self.local_generations.get(scope) for scope in scopes]
+
+            if None not in local:
+                return local
+
+        invalidations = self.invalidations
+        with metrics.timed(REDIS, command='mget'):
+            values = await self.redis.mget(
+                [key for scope in scopes for key in (generation_key(scope), soft_generation_key(scope))]
+            )
+        generations = [(int(hard or 0), int(soft or 0)) for hard, soft in zip(values[::2], values[1::2])]
+
+        # an invalidation that arrived during the round trip may be newer than what we read
+        if self.local_enabled and invalidations == self.invalidations:
+            self.local_generations.update(zip(scopes, generations))
+
+        return generations
+
+    async def versioned_key(self, key: str, *scopes: str) -> CacheKey:
+        generations = await self.generations(*scopes)
+
+        return CacheKey(
+            f"{key}@{'.'.join(str(hard) for hard, _ in generations)}",
+            '.'.join(str(soft) for _, soft in generations),
+        )
+
+    async def invalidate(self, *scopes: str, soft: bool = False) -> None:
+        """
+        Hard invalidation moves readers to new keys, they block on the database.
+        Soft invalidation keeps the keys and only marks their values stale.
+        """
+        scopes = tuple(dict.fromkeys(scopes))
+        self.drop_local_generations(*scopes)
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for scope in scopes:
+                key = soft_generation_key(scope) if soft else generation_key(scope)
+                # generations never expire, a counter restarting from zero would come back
+                # to numbers whose entries may still be alive and serve them as fresh
+                pipe.incr(key)
+            pipe.publish(INVALIDATION_CHANNEL, ' '.join(scopes))
+            with metrics.timed(REDIS, command='invalidate'):
+                await pipe.execute()
+
+    async def setex_page(self, list_key: CacheKey, page: CacheKey, ttl: int, value: str | bytes) -> bool:
+        """
+        Caches one page of a list. Pages are tracked per (versioned) list key and
+        only the first redis_max_cached_pages distinct pages are stored, deep or
+        exotic pagination keeps going to the database.
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.sadd(pages_key(list_key.key), page.key)
+            pipe.scard(pages_key(list_key.key))
+            with metrics.timed(REDIS, command='sadd'):
+                added, pages = await pipe.execute()
+
+        if added and pages > settings.redis_max_cached_pages:
+            await self.redis.srem(pages_key(list_key.key), page.key)
+            return False
+
+        raw = self.encode(page, ttl, value)
+
+        async with self.binary.pipeline(transaction=False) as pipe:
+            pipe.setex(page.key, ttl, raw)
+            pipe.expire(pages_key(list_key.key), ttl)
+            with metrics.timed(REDIS, command='setex'):
+                await pipe.execute()
+
+        return True
+
+    async def coalesce(self, key: CacheKey, load: Callable[[], Awaitable[T]], decode: Callable[[Any], T]) -> T:
+        """
+        Runs load() for a missed key once per worker and, through a redis lock, once
+        across workers: the others wait for the winner to fill the cache.
+        """
+        flight = self.flights.get(key.key)
+        if flight is not None:
+            try:
+                return await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # the request that was loading went away, take over
+                return await self.coalesce(key, load, decode)
+
+        flight = asyncio.get_running_loop().create_future()
+        self.flights[key.key] = flight
+
+        try:
+            result = await self.load_locked(key, load, decode)
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as exc:
+            flight.set_exception(exc)
+            # nobody may be waiting, don't let asyncio complain about it
+            flight.exception()
+            raise
+        else:
+            flight.set_result(result)
+        finally:
+            del self.flights[key.key]
+
+        return result
+
+    async def load_locked(self, key: CacheKey, load: Callable[[], Awaitable[T]], decode: Callable[[Any], T]) -> T:
+        token = uuid.uuid4().hex
+
+        if await self.redis.set(lock_key(key.key), token, nx=True, px=settings.cache_lock_ttl_ms):
+            try:
+                return await load()
+            finally:
+                await self.release_lock(keys=[lock_key(key.key)], args=[token])
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.cache_lock_wait
+
+        while loop.time() < deadline:
+            await asyncio.sleep(settings.cache_lock_poll_interval)
+
+            value = await self.get(key)
+            if value is not None:
+                return decode(value)
+
+        # the winner is too slow or could not cache the value, don't wait any longer
+        return await load()
+
+    async def clear_cache(self, *args: str | CacheKey | Iterable[str | CacheKey]) -> None:
+        keys = list(dict.fromkeys(flatten_keys(args)))
+
+        if not keys:
+            return
+
+        for key in keys:
+            self.local.pop(key, None)
 
-    def clear_cache(self, *args: str | list[str]) -> None:
-        for key in args:
-            self.redis.delete(str(key))
+        # UNLINK frees the memory in a background thread, all batches go in one round trip
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for start in range(0, len(keys), CLEAR_BATCH_SIZE):
+                pipe.unlink(*keys[start:start + CLEAR_BATCH_SIZE])
+            with metrics.timed(REDIS, command='unlink'):
+                await pipe.execute()
 
 
 redis = CacheCleaner()
@@ -1,6 +1,10 @@
+import uuid
+from typing import Any, Iterable
+
 from sqlalchemy import insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.crud import delete_rows, upsert_rows
 from src.core.models import Menu, SubMenu
 from src.submenu.schemas import SubMenuCreate, SubMenuUpdatePartial
 
@@ -15,21 +19,18 @@ async def get_submenu_by_id(
 
 
 async def get_submenus(
-    session: AsyncSession, menu: Menu, offset: int = 0, limit: int = 100
+    session: AsyncSession,
+    menu: Menu,
+    offset: int = 0,
+    limit: int = 100,
+    after: uuid.UUID | None = None,
 ) -> list[SubMenu]:
     query = (
-        select(SubMenu).where(SubMenu.menu_id == menu.id).offset(offset).limit(limit)
+        select(SubMenu).where(SubMenu.menu_id == menu.id).order_by(SubMenu.id).limit(limit)
     )
+    query = query.where(SubMenu.id > after) if after else query.offset(offset)
     result = await session.execute(query)
-
-    submenus = result.scalars().all()
-
-    from src.submenu.services import count_dishes
-
-    for sub_menu in submenus:
-        sub_menu.dishes_count = await count_dishes(session, sub_menu.id)
-
-    return submenus
+    return result.scalars().all()
 
 
 async def create_submenu(
@@ -69,10 +70,17 @@ async def delete_submenu(
     return {'status': True, 'message': 'The submenu has been deleted'}
 
 
-async def get_submenu_by_title(
+async def upsert_submenus(
     session: AsyncSession,
-    submenu_title: str,
-) -> SubMenu:
-    query = select(SubMenu).where(SubMenu.title == submenu_title)
-    result = await session.execute(query)
-    return result.scalars().first()
+    submenus: list[dict[str, Any]],
+    commit: bool = True,
+) -> list[SubMenu]:
+    return await upsert_rows(session, SubMenu, submenus, commit)
+
+
+async def delete_submenus(
+    session: AsyncSession,
+    submenu_ids: Iterable[uuid.UUID | str],
+    commit: bool = True,
+) -> int:
+    return await delete_rows(session, SubMenu, submenu_ids, commit)
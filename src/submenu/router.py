@@ -1,19 +1,26 @@
-from fastapi import APIRouter, BackgroundTasks, Depends, status
+from typing import Annotated
+
+from fastapi import APIRouter, BackgroundTasks, Depends, Path, Request, Response, status
+from pydantic import UUID4
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.responses import JSONResponse
 
 from src.core.database import get_async_session
 from src.core.models import Menu, SubMenu
+from src.core.pagination import decode_cursor, set_next_cursor
 from src.core.schemas import ErrorResponse, SuccessResponse
-from src.core.services import create_background_task
-from src.menu.services import menu_by_id
-from src.redis.utils import redis
+from src.core.services import (
+    conflict_on_integrity_error,
+    create_background_task,
+    json_response,
+)
+from src.menu.services import clear_menu_cache, menu_by_id
 from src.submenu import crud
 from src.submenu.schemas import SubMenuCreate, SubMenuRead, SubMenuUpdatePartial
 from src.submenu.services import (
-    check_unique_submenu,
-    clear_submenu_cache,
+    get_submenu_cache,
     load_all_submenus,
+    load_submenu,
     submenu_by_id,
 )
 
@@ -45,18 +52,10 @@ async def create_submenu(
     :param session:
     :return: sub_menu
     """
-    await check_unique_submenu(submenu.title, session)
+    await create_background_task(background_tasks, clear_menu_cache, menu.id)
 
-    await create_background_task(
-        background_tasks,
-        redis.clear_cache,
-        'all_menus',
-        'all_submenus',
-        f'menu_{menu.id}',
-        'all_menus_nested'
-    )
-
-    sub_menu = await crud.create_submenu(session, menu, submenu)
+    async with conflict_on_integrity_error(session, 'submenu cannot be in 2 menus at the same time'):
+        sub_menu = await crud.create_submenu(session, menu, submenu)
 
     return sub_menu
 
@@ -68,19 +67,26 @@ async def create_submenu(
     summary='Получить все подменю'
 )
 async def get_submenus(
+    response: Response,
     session: AsyncSession = Depends(get_async_session),
     menu: Menu = Depends(menu_by_id),
     offset: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
 ) -> list[SubMenuRead]:
     """
     \f
     :param session:
     :param menu_id:
+    :param offset:
+    :param limit:
+    :param cursor:
     :return: submenus
     """
 
-    submenus = await load_all_submenus(session, menu, offset, limit)
+    submenus = await load_all_submenus(session, menu, offset, limit, decode_cursor(cursor))
+
+    set_next_cursor(response, submenus, limit)
 
     return submenus
 
@@ -98,16 +104,26 @@ async def get_submenus(
     }
 )
 async def get_submenu(
-    submenu: SubMenu = Depends(submenu_by_id),
-) -> SubMenuRead:
+    menu_id: Annotated[UUID4, Path],
+    submenu_id: Annotated[UUID4, Path],
+    request: Request,
+    session: AsyncSession = Depends(get_async_session),
+) -> Response:
     """
     \f
     :param menu_id:
     :param submenu_id:
+    :param session:
     :return: submenu
     """
+    cache_key, cache = await get_submenu_cache(menu_id, submenu_id)
+
+    if cache:
+        return json_response(cache.value, request, cache.etag)
 
-    return submenu
+    submenu = await load_submenu(session, submenu_id, menu_id, cache_key)
+
+    return json_response(SubMenuRead.model_validate(submenu, from_attributes=True).model_dump_json(), request)
 
 
 @router.patch(
@@ -119,6 +135,10 @@ async def get_submenu(
         404: {
             'description': 'submenu not found',
             'model': ErrorResponse
+        },
+        409: {
+            'description': 'submenu cannot be in 2 menus at the same time',
+            'model': ErrorResponse
         }
     }
 )
@@ -136,16 +156,12 @@ async def update_submenu(
     :param session:
     :return: submenu
     """
-    await create_background_task(
-        background_tasks,
-        redis.clear_cache,
-        f'{submenu.menu_id}_submenu_{submenu.id}',
-        'all_submenus'
-    )
+    await create_background_task(background_tasks, clear_menu_cache, submenu.menu_id)
 
-    return await crud.update_submenu_partial(
-        session=session, submenu=submenu, submenu_update=submenu_update
-    )
+    async with conflict_on_integrity_error(session, 'submenu cannot be in 2 menus at the same time'):
+        return await crud.update_submenu_partial(
+            session=session, submenu=submenu, submenu_update=submenu_update
+        )
 
 
 @router.delete(
@@ -174,11 +190,6 @@ async def delete_submenu(
     :param submenu_id:
     :return: result
     """
-    await create_background_task(
-        background_tasks,
-        clear_submenu_cache,
-        submenu.menu_id,
-        submenu.id
-    )
+    await create_background_task(background_tasks, clear_menu_cache, submenu.menu_id)
 
     return await crud.delete_submenu(session, submenu)
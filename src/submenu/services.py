@@ -1,95 +1,138 @@
-import json
+import uuid
+from functools import partial
 from typing import Annotated
 
+import orjson
 from fastapi import Depends, HTTPException, Path, Request, status
 from fastapi.encoders import jsonable_encoder
 from pydantic import UUID4
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.database import get_async_session
-from src.core.models import Dish, Menu, SubMenu
+from src.core.models import Menu, SubMenu
+from src.core.services import in_new_session
+from src.redis.codec import CacheEntry
+from src.redis.keys import (
+    CacheKey,
+    menu_scope,
+    menu_submenus_key,
+    page_key,
+    submenu_key,
+    submenu_scope,
+)
 from src.redis.utils import redis
 from src.submenu import crud
-from src.submenu.crud import get_submenu_by_id, get_submenu_by_title
+from src.submenu.crud import get_submenu_by_id
 from src.submenu.schemas import SubMenuRead
 
-r = redis.get_redis_client()
 
-
-async def submenu_by_id(
-    submenu_id: Annotated[UUID4, Path],
-    request: Request,
-    session: AsyncSession = Depends(get_async_session),
+async def fetch_submenu(
+    session: AsyncSession,
+    submenu_id: UUID4,
+    menu_id: UUID4 | None = None,
+    cache_key: CacheKey | None = None,
 ) -> SubMenu:
-    submenu_key = r.keys(f'*_submenu_{submenu_id}')
-
-    cache = r.get(submenu_key[0]) if submenu_key else None
-
-    if cache and request.method == 'GET':
-        return SubMenuRead(**json.loads(cache))
-
     submenu = await get_submenu_by_id(session, submenu_id)
     if not submenu:
+        if cache_key:
+            # a soft invalidated entry of a deleted submenu must not be served on
+            await redis.clear_cache(cache_key)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail='submenu not found'
         )
 
-    submenu.dishes_count = await count_dishes(session, submenu_id)
-
-    if request.method == 'GET':
-        r.setex(
-            f'{submenu.menu_id}_submenu_{submenu.id}',
-            600,
-            json.dumps(jsonable_encoder(submenu)),
-        )
+    if cache_key:
+        # the key carries the generation of the menu from the path, only cache under the real parent
+        if submenu.menu_id == menu_id:
+            await redis.setex(
+                cache_key, 600, SubMenuRead.model_validate(submenu, from_attributes=True).model_dump_json()
+            )
+        else:
+            await redis.clear_cache(cache_key)
 
     return submenu
 
 
-async def check_unique_submenu(
-    submenu_title: Annotated[str, Path],
-    session: AsyncSession,
-) -> None:
-    result = await get_submenu_by_title(session, submenu_title)
+async def get_submenu_cache(menu_id: UUID4, submenu_id: UUID4) -> tuple[CacheKey, CacheEntry | None]:
+    cache_key = await redis.versioned_key(submenu_key(submenu_id), menu_scope(menu_id), submenu_scope(submenu_id))
+    refresh = partial(
+        in_new_session, partial(fetch_submenu, submenu_id=submenu_id, menu_id=menu_id, cache_key=cache_key)
+    )
 
-    if result:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail='submenu cannot be in 2 menus at the same time',
-        )
+    return cache_key, await redis.get_entry(cache_key, refresh)
 
 
-async def count_dishes(
+async def load_submenu(
     session: AsyncSession,
-    submenu_id: str,
-) -> int:
-    query = select(Dish).where(Dish.submenu_id == submenu_id)
-    result = await session.execute(query)
-    return len(result.scalars().all())
-
+    submenu_id: UUID4,
+    menu_id: UUID4 | None = None,
+    cache_key: CacheKey | None = None,
+) -> SubMenu | SubMenuRead:
+    if not cache_key:
+        return await fetch_submenu(session, submenu_id)
 
-def clear_submenu_cache(menu_id: str, submenu_id: str) -> None:
-    redis.clear_main_cache()
+    return await redis.coalesce(
+        cache_key,
+        partial(fetch_submenu, session, submenu_id, menu_id, cache_key),
+        SubMenuRead.model_validate_json,
+    )
 
-    redis.clear_cache(f'menu_{menu_id}', f'{menu_id}_submenu_{submenu_id}')
 
-    dish_keys = r.keys(f'{submenu_id}_dish_*')
+async def submenu_by_id(
+    menu_id: Annotated[UUID4, Path],
+    submenu_id: Annotated[UUID4, Path],
+    request: Request,
+    session: AsyncSession = Depends(get_async_session),
+) -> SubMenu:
+    if request.method != 'GET':
+        return await load_submenu(session, submenu_id)
 
-    if dish_keys:
-        redis.clear_cache(dish_keys)
+    cache_key, cache = await get_submenu_cache(menu_id, submenu_id)
 
+    if cache:
+        return SubMenuRead.model_validate_json(cache.value)
 
-async def load_all_submenus(session: AsyncSession, menu: Menu, offset: int, limit: int) -> list[SubMenu]:
-    cache = r.get('all_submenus')
-    params = r.get('submenus_params')
+    return await load_submenu(session, submenu_id, menu_id, cache_key)
 
-    if cache and params == f'{offset}_{limit}':
-        return json.loads(cache)
 
-    sub_menus = await crud.get_submenus(session, menu, offset, limit)
+async def fetch_submenus_page(
+    session: AsyncSession,
+    menu: Menu,
+    list_key: CacheKey,
+    cache_key: CacheKey,
+    offset: int,
+    limit: int,
+    after: uuid.UUID | None = None,
+) -> list[SubMenu]:
+    sub_menus = await crud.get_submenus(session, menu, offset, limit, after)
 
-    r.setex('all_submenus', 3600, json.dumps(jsonable_encoder(sub_menus)))
-    r.setex('submenus_params', 3600, f'{offset}_{limit}')
+    await redis.setex_page(list_key, cache_key, 3600, orjson.dumps(jsonable_encoder(sub_menus)))
 
     return sub_menus
+
+
+async def load_all_submenus(
+    session: AsyncSession,
+    menu: Menu,
+    offset: int,
+    limit: int,
+    after: uuid.UUID | None = None,
+) -> list[SubMenu]:
+    list_key = await redis.versioned_key(menu_submenus_key(menu.id), menu_scope(menu.id))
+    cache_key = page_key(list_key, offset, limit, after)
+    fetch = partial(
+        fetch_submenus_page,
+        menu=menu,
+        list_key=list_key,
+        cache_key=cache_key,
+        offset=offset,
+        limit=limit,
+        after=after,
+    )
+
+    cache = await redis.get(cache_key, partial(in_new_session, fetch))
+
+    if cache:
+        return orjson.loads(cache)
+
+    return await redis.coalesce(cache_key, partial(fetch, session), orjson.loads)
@@ -2,6 +2,9 @@ import asyncio
 
 from celery import Celery
 
+from src.core.database import engine
+from src.core.metrics import metrics
+from src.redis.utils import redis
 from tasks.update_db import db_updater
 
 app = Celery('tasks', backend='rpc://', broker='pyamqp://')
@@ -14,6 +17,16 @@ app.conf.beat_schedule = {
 }
 
 
+async def run_synchronization() -> None:
+    try:
+        await db_updater.update_db_online()
+    finally:
+        # every task runs in a fresh event loop, pooled connections can't outlive it
+        await engine.dispose()
+        await metrics.stop_flusher(redis.get_redis_client())
+        await redis.close()
+
+
 @app.task
 def db_synchronization():
-    asyncio.run(db_updater.update_db_online())
+    asyncio.run(run_synchronization())
@@ -1,48 +1,200 @@
 import asyncio
-import json
-from typing import Any
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Iterator
 
 import pandas as pd
-from fastapi.encoders import jsonable_encoder
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.base import Base
 from src.core.config import settings
+from src.core.crud import delete_rows, upsert_rows
 from src.core.database import get_async_context
-from src.dish.crud import create_dish, delete_dish, get_dish_by_id, update_dish_partial
-from src.dish.schemas import DishCreate, DishRead, DishUpdatePartial
-from src.dish.services import clear_dish_cache, load_all_dishes
-from src.menu.crud import (
-    create_menu,
-    delete_menu,
-    get_menu_by_id,
-    get_menu_by_title,
-    update_menu_partial,
-)
-from src.menu.schemas import MenuCreate, MenuRead, MenuUpdatePartial
-from src.menu.services import clear_menu_cache, load_all_menus
+from src.core.metrics import SYNC, metrics
+from src.core.models import Dish, Menu, SubMenu
+from src.core.warmup import warm_up_cache
+from src.dish.schemas import DishCreate
+from src.dish.services import set_discounts
+from src.menu.schemas import MenuCreate
+from src.redis.keys import CATALOG, menu_scope
 from src.redis.utils import redis
-from src.submenu.crud import (
-    create_submenu,
-    delete_submenu,
-    get_submenu_by_id,
-    update_submenu_partial,
-)
-from src.submenu.schemas import SubMenuCreate, SubMenuRead, SubMenuUpdatePartial
-from src.submenu.services import clear_submenu_cache, load_all_submenus
+from src.submenu.schemas import SubMenuCreate
 
+logger = logging.getLogger(__name__)
+
+# parents first, children are inserted and moved before their old parents are deleted
+MODELS: tuple[type[Base], ...] = (Menu, SubMenu, Dish)
+
+
+def parse_id(value: Any) -> uuid.UUID | None:
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
 
-class DbUpdater:
-    def __init__(self) -> None:
-        self.redis = redis
 
-        self.dishes_ids: list[str] = []
-        self.menus_ids: list[str] = []
+class SyncPlan:
+    """
+    Changes that bring the database in line with the sheet. Rows are plain dicts
+    for bulk statements, ids of new rows are generated here so that children and
+    the sheet can refer to them before anything is written.
+    """
 
-        self.google_dishes_ids: list[str] = []
-        self.google_menus_ids: list[str] = []
+    def __init__(self) -> None:
+        self.create: dict[type[Base], list[dict[str, Any]]] = {model: [] for model in MODELS}
+        self.update: dict[type[Base], list[dict[str, Any]]] = {model: [] for model in MODELS}
+        self.delete: dict[type[Base], set[uuid.UUID]] = {model: set() for model in MODELS}
+        self.kept: dict[type[Base], set[uuid.UUID]] = {model: set() for model in MODELS}
 
+        # (column, row, id) of sheet cells that don't hold the id of their row yet
+        self.sheet_ids: list[tuple[str, int, str]] = []
         self.discounts: dict[str, float] = {}
+        # menus whose cached trees change in place, stale entries may be served while refreshed
+        self.menu_ids: set[uuid.UUID] = set()
+        # menus that lose or gain rows by deletes and moves, their entries must not be served at all
+        self.hard_menu_ids: set[uuid.UUID] = set()
+
+    def __bool__(self) -> bool:
+        return any(self.create[model] or self.update[model] or self.delete[model] for model in MODELS)
+
+    def __str__(self) -> str:
+        return ', '.join(
+            f'{model.__tablename__} +{len(self.create[model])} ~{len(self.update[model])} -{len(self.delete[model])}'
+            for model in MODELS
+        )
+
+    def upsert(
+        self,
+        model: type[Base],
+        rows: dict[uuid.UUID, dict[str, Any]],
+        titles: dict[str, uuid.UUID],
+        google_row: dict[str, Any],
+        column: str,
+        values: dict[str, Any],
+    ) -> tuple[uuid.UUID, bool]:
+        """
+        Matches a sheet row by id, then by title (titles are unique), and plans
+        its insert or update. Returns the id the row will have and whether it changes.
+        """
+        row_id = parse_id(google_row['id'])
+
+        if row_id not in rows:
+            row_id = titles.get(values['title'])
+
+        # a row copied in the sheet becomes a new one
+        if row_id in self.kept[model]:
+            row_id = None
+
+        changed = True
+
+        if row_id is None:
+            row_id = uuid.uuid4()
+            self.create[model].append({'id': row_id, **values})
+        elif any(rows[row_id][name] != value for name, value in values.items()):
+            self.update[model].append({'id': row_id, **values})
+        else:
+            changed = False
+
+        self.kept[model].add(row_id)
+
+        if str(google_row['id']) != str(row_id):
+            self.sheet_ids.append((column, google_row['index'], str(row_id)))
+
+        return row_id, changed
+
+
+async def load_tree(session: AsyncSession) -> dict[type[Base], dict[uuid.UUID, dict[str, Any]]]:
+    columns = {
+        Menu: (Menu.id, Menu.title, Menu.description),
+        SubMenu: (SubMenu.id, SubMenu.title, SubMenu.description, SubMenu.menu_id),
+        Dish: (Dish.id, Dish.title, Dish.description, Dish.price, Dish.submenu_id),
+    }
+    tree = {}
+
+    for model, model_columns in columns.items():
+        result = await session.execute(select(*model_columns))
+        tree[model] = {row['id']: dict(row) for row in result.mappings()}
+
+    return tree
+
+
+def plan_sync(sheet: list[dict[str, Any]], tree: dict[type[Base], dict[uuid.UUID, dict[str, Any]]]) -> SyncPlan:
+    plan = SyncPlan()
+    menus, submenus, dishes = tree[Menu], tree[SubMenu], tree[Dish]
+    titles = {model: {row['title']: row_id for row_id, row in tree[model].items()} for model in MODELS}
+
+    for google_menu in sheet:
+        values = MenuCreate(title=google_menu['title'], description=google_menu['description']).model_dump()
+        menu_id, changed = plan.upsert(Menu, menus, titles[Menu], google_menu, 'A', values)
+
+        if changed:
+            plan.menu_ids.add(menu_id)
+
+        for google_submenu in google_menu['submenus']:
+            values = SubMenuCreate(
+                title=google_submenu['title'], description=google_submenu['description']
+            ).model_dump()
+            submenu_id, changed = plan.upsert(
+                SubMenu, submenus, titles[SubMenu], google_submenu, 'B', {**values, 'menu_id': menu_id}
+            )
+
+            old_menu_id = submenus.get(submenu_id, {}).get('menu_id', menu_id)
+
+            if old_menu_id != menu_id:
+                plan.hard_menu_ids.update({menu_id, old_menu_id})
+            elif changed:
+                plan.menu_ids.add(menu_id)
+
+            for google_dish in google_submenu['dishes']:
+                values = DishCreate(
+                    title=google_dish['title'], description=google_dish['description'], price=google_dish['price']
+                ).model_dump()
+                dish_id, changed = plan.upsert(
+                    Dish, dishes, titles[Dish], google_dish, 'C', {**values, 'submenu_id': submenu_id}
+                )
+
+                old_submenu_id = dishes.get(dish_id, {}).get('submenu_id', submenu_id)
+
+                if old_submenu_id != submenu_id:
+                    plan.hard_menu_ids.update({menu_id, submenus[old_submenu_id]['menu_id']})
+                elif changed:
+                    plan.menu_ids.add(menu_id)
+
+                plan.discounts[str(dish_id)] = google_dish['discount']
+
+    for model in MODELS:
+        plan.delete[model] = set(tree[model]) - plan.kept[model]
+
+    plan.hard_menu_ids |= plan.delete[Menu]
+    plan.hard_menu_ids |= {submenus[submenu_id]['menu_id'] for submenu_id in plan.delete[SubMenu]}
+    plan.hard_menu_ids |= {submenus[dishes[dish_id]['submenu_id']]['menu_id'] for dish_id in plan.delete[Dish]}
+    plan.menu_ids -= plan.hard_menu_ids
+
+    return plan
+
+
+async def apply_plan(session: AsyncSession, plan: SyncPlan) -> None:
+    # free the titles of removed dishes before anything takes them
+    await delete_rows(session, Dish, plan.delete[Dish], commit=False)
+
+    # one INSERT ... ON CONFLICT (id) DO UPDATE per table covers new and changed rows
+    for model in MODELS:
+        await upsert_rows(session, model, plan.create[model] + plan.update[model], commit=False)
+
+    # deleted only now, so that children moved out of them are not cascaded away
+    for model in (SubMenu, Menu):
+        await delete_rows(session, model, plan.delete[model], commit=False)
+
+
+class DbUpdater:
+    def __init__(self) -> None:
+        self.redis = redis
+        self.timings: dict[str, float] = {}
 
     async def parse_google_sheet(self) -> list[dict[str, Any]]:
 
@@ -107,315 +259,71 @@ class DbUpdater:
 
         return res
 
-    async def update_all_data(self, menu: MenuRead, google_menu: dict[str, Any]) -> None:
-        async with get_async_context() as session:
-            serialized_submenus = await self.get_all_submenus(menu)
-
-            submenus_ids = [submenu['id'] for submenu in serialized_submenus] or []
-            submenus_titles = [submenu['title'] for submenu in serialized_submenus] or []
-
-            google_submenus_ids = []
-
-            for google_submenu in google_menu['submenus']:
-                google_submenu_id = google_submenu['id']
-                google_submenu_title = google_submenu['title']
-
-                new_submenu = SubMenuUpdatePartial(
-                    title=google_submenu['title'],
-                    description=google_submenu['description']
-                )
-
-                if google_submenu_id in submenus_ids:
-
-                    submenu = await get_submenu_by_id(session, google_submenu_id)
-
-                    redis.clear_cache(
-                        f'{submenu.menu_id}_submenu_{submenu.id}',
-                        'all_submenus'
-                    )
-
-                    await update_submenu_partial(session, submenu, new_submenu)
-
-                elif google_submenu_title in submenus_titles:
-
-                    submenu_id = [submenu['id']
-                                  for submenu in serialized_submenus if submenu['title'] == google_submenu_title][0]
-
-                    submenu = await get_submenu_by_id(session, submenu_id)
-
-                    redis.clear_cache(
-                        f'{submenu.menu_id}_submenu_{submenu.id}',
-                        'all_submenus'
-                    )
-
-                    await update_submenu_partial(session, submenu, new_submenu)
-
-                    google_submenu_id = submenu_id
-
-                else:
-
-                    redis.clear_cache(
-                        'all_menus',
-                        'all_submenus',
-                        f'menu_{menu.id}',
-                        'all_menus_nested'
-                    )
-
-                    submenu = await create_submenu(session, menu, new_submenu)
-
-                    google_submenu_id = str(submenu.id)
-
-                await self.update_sheet_values('B', google_submenu['index'], str(google_submenu_id))
-
-                for google_dish in google_submenu['dishes']:
-                    google_dish_id = google_dish['id']
+    async def update_sheet_ids(self, sheet_ids: list[tuple[str, int, str]]) -> None:
+        ''' Записывает id новых объектов в google_sheet одним запросом '''
+        if not sheet_ids:
+            return
 
-                    new_dish = DishUpdatePartial(
-                        title=google_dish['title'],
-                        description=google_dish['description'],
-                        price=google_dish['price']
-                    )
-
-                    if google_dish_id in self.dishes_ids:
-
-                        dish = await get_dish_by_id(session, google_dish_id)
-
-                        redis.clear_cache(
-                            f'{dish.submenu_id}_dish_{dish.id}',
-                            'all_dishes',
-                            'all_menus_nested'
-                        )
-                        await update_dish_partial(session, dish, new_dish)
-
-                    else:
-
-                        redis.clear_cache('all_dishes')
-                        clear_menu_cache(menu.id)
-                        clear_submenu_cache(menu.id, submenu.id)
-
-                        dish = await create_dish(session, new_dish, submenu)
-
-                        google_dish_id = str(dish.id)
-
-                        await self.update_sheet_values('C', google_dish['index'], str(google_dish_id))
-
-                    self.google_dishes_ids.append(google_dish_id)
-
-                    self.discounts[google_dish_id] = google_dish['discount']
-
-                google_submenus_ids.append(google_submenu_id)
-
-            for submenu_id in submenus_ids:
-                if submenu_id not in google_submenus_ids:
-                    submenu = await get_submenu_by_id(session, submenu_id)
-                    clear_submenu_cache(
-                        submenu.menu_id,
-                        submenu.id
-                    )
-                    await delete_submenu(session, submenu)
-
-    async def create_all_data(self, menu: MenuRead, google_menu: dict[str, Any]) -> None:
-        async with get_async_context() as session:
-            await self.update_sheet_values('A', google_menu['index'], str(menu.id))
-
-            for google_submenu in google_menu['submenus']:
-
-                submenu_create = SubMenuCreate(
-                    title=google_submenu['title'],
-                    description=google_submenu['description']
-                )
-
-                redis.clear_cache(
-                    'all_menus',
-                    'all_submenus',
-                    f'menu_{menu.id}',
-                    'all_menus_nested'
-                )
-
-                submenu = await create_submenu(session, menu, submenu_create)
-
-                await self.update_sheet_values('B', google_submenu['index'], str(submenu.id))
-
-                for google_dish in google_submenu['dishes']:
-
-                    dish_create = DishCreate(
-                        title=google_dish['title'],
-                        description=google_dish['description'],
-                        price=google_dish['price']
-                    )
-
-                    redis.clear_cache('all_dishes')
-                    clear_menu_cache(menu.id)
-                    clear_submenu_cache(menu.id, submenu.id)
-
-                    dish = await create_dish(session, dish_create, submenu)
-
-                    self.google_dishes_ids.append(str(dish.id))
-
-                    await self.update_sheet_values('C', google_dish['index'], str(dish.id))
-
-    async def update_menu(self, menu_id: str, google_menu: dict[str, Any]) -> None:
-        async with get_async_context() as session:
-            '''
-            Идем в бд по id меню из таблицы, если оно есть, сразу патчим
-            и обновляем зависимости.
-            '''
-            try:
-                menu = await get_menu_by_id(session, menu_id)
-            except Exception:
-                menu = None
-
-            if menu:
-                menu_update = MenuUpdatePartial(
-                    title=google_menu['title'],
-                    description=google_menu['description']
-                )
-
-                self.redis.clear_cache(
-                    f'menu_{menu.id}',
-                    'all_menus',
-                    'all_menus_nested'
-                )
-
-                await update_menu_partial(session, menu, menu_update)
-
-                await self.update_all_data(menu, google_menu)
-
-            else:
-                '''
-                Если не нашли по id (значит меню либо нету, либо до этого когда то создавалось в бд вручную),
-                проверяем нету ли с меню с таким названием, если есть - то получаем его id и обновлянем зависимости.
-                Если нету, то создаем его и все зависимости.
-                '''
-                async with get_async_context() as session:
-
-                    menu = await get_menu_by_title(session, google_menu['title'])
-
-                    if menu:
-                        serialized_menus = await self.get_all_menus()
-
-                        menu_id = [menu['id'] for menu in serialized_menus if google_menu['title'] == menu['title']][0]
-
-                        await self.update_all_data(menu, google_menu)
-
-                    else:
-                        menu_create = MenuCreate(
-                            title=google_menu['title'],
-                            description=google_menu['description']
-                        )
+        request = self.sheet.values().batchUpdate(
+            spreadsheetId=self.spreadsheet_id,
+            body={
+                'valueInputOption': 'RAW',
+                'data': [
+                    {'range': f'sheet1!{column}{row + 1}', 'values': [[value]]}
+                    for column, row, value in sheet_ids
+                ],
+            },
+        )
+        await asyncio.to_thread(request.execute)
 
-                        redis.clear_cache('all_menus', 'all_menus_nested')
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+            metrics.histogram(SYNC, phase=name).observe(self.timings[name])
 
-                        menu = await create_menu(session, menu_create)
+    async def update_db_online(self) -> None:
+        self.timings = {}
 
-                        self.google_menus_ids.append(str(menu.id))
+        with self.phase('sheet'):
+            sheet = await self.parse_google_sheet()
 
-                        await self.create_all_data(menu, google_menu)
+        # the diff is applied in the transaction it was computed in
+        async with get_async_context() as session, session.begin():
+            with self.phase('load'):
+                tree = await load_tree(session)
 
-    async def update_sheet_values(self, table: str, row: int, values: str) -> None:
-        ''' Метод для вставки данных в таблицу google_sheet '''
-        self.sheet.values().update(
-            spreadsheetId=self.spreadsheet_id,
-            range=f'sheet1!{table}{row + 1}',
-            valueInputOption='RAW',
-            body={'values': [[values]]}
-        ).execute()
-
-    async def delete_conflict_objects(self) -> None:
-
-        ''' Метод удаляет все блюды и меню которые есть в бд, но отсутсвуют в таблице '''
-
-        async with get_async_context() as session:
-            dishes: list[DishRead] = await self.get_all_dishes()
-            menus: list[MenuRead] = await self.get_all_menus()
-
-            for dish in dishes:
-                dish_id = dish.get('id')
-                dish_submenu_id = dish.get('submenu_id')
-                if dish_id not in self.google_dishes_ids:
-                    dish = await get_dish_by_id(session, dish_id)
-                    clear_dish_cache(dish_submenu_id, dish_id)
-                    await delete_dish(session, dish)
-
-            for menu in menus:
-                menu_id = menu.get('id')
-                if menu_id not in self.google_menus_ids:
-                    menu = await get_menu_by_id(session, menu_id)  # type: ignore
-                    clear_menu_cache(menu_id)
-                    await delete_menu(session, menu)
-
-            self.google_menus_ids = []
-            self.google_dishes_ids = []
-
-    async def get_all_menus(self) -> list[MenuRead]:
-        async with get_async_context() as session:
-            all_menus = await load_all_menus(session, 0, 100)
-            if all(isinstance(menu, dict) for menu in all_menus):
-                serialized_menus = all_menus
-            else:
-                serialized_menus = []
-                for menu in all_menus:
-                    serialized_menus.append({  # type: ignore
-                        'id': str(menu.id),
-                        'title': menu.title,
-                        'description': menu.description
-                    })
-
-        return serialized_menus
-
-    async def get_all_dishes(self) -> list[DishRead]:
-        async with get_async_context() as session:
-            dishes = await load_all_dishes(session, 0, 100)
-            if all(isinstance(dish, dict) for dish in dishes):
-                serialized_dishes = dishes
-            else:
-                serialized_dishes = []
-                for dish in dishes:
-                    serialized_dishes.append({  # type: ignore
-                        'id': str(dish.id),
-                        'title': dish.title,
-                        'description': dish.description,
-                        'price': dish.price
-                    })
-
-        return serialized_dishes
-
-    async def get_all_submenus(self, menu: MenuRead) -> list[SubMenuRead]:
-        async with get_async_context() as session:
-            submenus = await load_all_submenus(session, menu, 0, 100)
-            if all(isinstance(submenu, dict) for submenu in submenus):
-                serialized_submenus = submenus
-            else:
-                serialized_submenus = []
-                for submenu in submenus:
-                    serialized_submenus.append({  # type: ignore
-                        'id': str(submenu.id),
-                        'title': submenu.title,
-                        'description': submenu.description
-                    })
-
-        return serialized_submenus
+            with self.phase('diff'):
+                plan = plan_sync(sheet, tree)
 
-    async def update_db_online(self) -> None:
-        dishes = await self.get_all_dishes()
-        self.dishes_ids = [dish['id'] for dish in dishes]
+            with self.phase('apply'):
+                if plan:
+                    await apply_plan(session, plan)
 
-        res = await self.parse_google_sheet()
-        tasks = []
+        with self.phase('write_back'):
+            await self.update_sheet_ids(plan.sheet_ids)
 
-        for google_menu in res:
-            menu_id = google_menu['id']
-            self.google_menus_ids.append(str(menu_id))
+        with self.phase('cache'):
+            if plan.hard_menu_ids:
+                await redis.invalidate(CATALOG, *map(menu_scope, plan.hard_menu_ids))
 
-            task = asyncio.create_task(self.update_menu(menu_id, google_menu))
-            tasks.append(task)
+            if plan.menu_ids:
+                await redis.invalidate(CATALOG, *map(menu_scope, plan.menu_ids), soft=True)
 
-        for task in tasks:
-            await task
+            discounts_changed = await set_discounts(plan.discounts)
 
-        await self.delete_conflict_objects()
+            # nothing changed, the cache is warmed by the requests it serves
+            if plan or discounts_changed:
+                await warm_up_cache()
 
-        self.redis.get_redis_client().set('discounts', json.dumps(jsonable_encoder(self.discounts)))
+        logger.info(
+            'sheet sync: %s; %s',
+            plan,
+            ', '.join(f'{name} {elapsed:.3f}s' for name, elapsed in self.timings.items()),
+        )
 
 
 db_updater = DbUpdater()
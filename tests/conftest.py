@@ -1,17 +1,17 @@
 import asyncio
+from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
 import pytest
 from fastapi.testclient import TestClient
 from httpx import AsyncClient
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool
 
 from main import app
 from src.core.base import Base
 from src.core.config import settings
-from src.core.database import get_async_session
+from src.core.database import build_engine, get_async_session
 from src.redis.utils import redis
 
 r = redis.get_redis_client()
@@ -19,7 +19,7 @@ metadata = Base.metadata
 
 DATABASE_URL_TEST = settings.test_db_url
 
-engine_test = create_async_engine(DATABASE_URL_TEST, poolclass=NullPool)
+engine_test = build_engine(DATABASE_URL_TEST, null_pool=True)
 async_session_maker = sessionmaker(
     bind=engine_test, class_=AsyncSession, expire_on_commit=False
 )
@@ -32,6 +32,12 @@ async def override_get_async_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+@asynccontextmanager
+async def override_get_async_context() -> AsyncGenerator[AsyncSession, None]:
+    async with async_session_maker() as session:
+        yield session
+
+
 app.dependency_overrides[get_async_session] = override_get_async_session
 
 
@@ -59,4 +65,6 @@ async def ac() -> AsyncGenerator[AsyncClient, None]:
     async with AsyncClient(app=app, base_url='http://test') as ac:
         yield ac
 
-    r.flushall()
+    # pooled connections belong to the loop the tests ran in, teardown may run in another one
+    r.connection_pool.reset()
+    await r.flushall()
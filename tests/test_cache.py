@@ -0,0 +1,218 @@
+import asyncio
+import os
+from typing import Awaitable, Callable
+
+import orjson
+import pytest
+from httpx import AsyncClient
+
+from src.core import services
+from src.core.config import settings
+from src.menu.crud import delete_menus
+from src.redis.codec import RAW, ZLIB, decode_entry, encode_entry
+from src.redis.keys import (
+    CATALOG,
+    INVALIDATION_CHANNEL,
+    CacheKey,
+    generation_key,
+    lock_key,
+    menu_scope,
+)
+from src.redis.utils import redis
+from tests.conftest import async_session_maker, override_get_async_context
+from tests.utils import reverse
+
+r = redis.get_redis_client()
+
+"""Проверка кеша: формат записей, single-flight, мягкая инвалидация, локальный кеш"""
+
+
+@pytest.mark.order(7)
+class TestCodec:
+    def round_trip(self, payload: bytes) -> int:
+        raw, entry = encode_entry(payload, '3.1', 600)
+        decoded = decode_entry(raw)
+
+        assert decoded == entry
+        assert decoded.value == payload
+        assert decoded.tag == '3.1'
+
+        return raw[0]
+
+    def test_payload_with_separator(self) -> None:
+        assert self.round_trip(b'{"title": "a|b|c", "description": "|"}') == RAW
+
+    def test_compress_threshold(self) -> None:
+        assert self.round_trip(b'x' * (settings.cache_compress_min_bytes - 1)) == RAW
+        assert self.round_trip(b'x' * settings.cache_compress_min_bytes) == ZLIB
+
+    def test_incompressible_payload(self) -> None:
+        # random bytes do not shrink, they are stored as they are
+        assert self.round_trip(os.urandom(settings.cache_compress_min_bytes * 2)) == RAW
+
+
+@pytest.mark.order(7)
+class TestCache:
+    @pytest.mark.asyncio
+    async def test_coalesce_single_flight(self) -> None:
+        key = CacheKey('test:coalesce:single')
+        calls = 0
+
+        async def load() -> str:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            await redis.setex(key, 60, orjson.dumps('value'))
+            return 'value'
+
+        results = await asyncio.gather(*[redis.coalesce(key, load, orjson.loads) for _ in range(10)])
+
+        assert calls == 1
+        assert results == ['value'] * 10
+
+        await redis.clear_cache(key)
+
+    @pytest.mark.asyncio
+    async def test_coalesce_leader_cancelled(self) -> None:
+        key = CacheKey('test:coalesce:cancelled')
+        started = asyncio.Event()
+        calls = 0
+
+        async def load() -> int:
+            nonlocal calls
+            calls += 1
+            started.set()
+            await asyncio.sleep(0.05)
+            return calls
+
+        leader = asyncio.create_task(redis.coalesce(key, load, orjson.loads))
+        await started.wait()
+
+        waiter = asyncio.create_task(redis.coalesce(key, load, orjson.loads))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        # the waiter takes over and loads on its own
+        assert await waiter == 2
+        assert leader.cancelled()
+        assert key.key not in redis.flights
+        assert await r.exists(lock_key(key.key)) == 0
+
+    @pytest.mark.asyncio
+    async def test_coalesce_waits_for_other_worker(self) -> None:
+        key = CacheKey('test:coalesce:locked')
+        await r.set(lock_key(key.key), 'other worker', px=5000)
+
+        async def fill() -> None:
+            await asyncio.sleep(0.1)
+            await redis.setex(key, 60, orjson.dumps('from other worker'))
+
+        async def load() -> str:
+            raise AssertionError('the other worker is loading')
+
+        filling = asyncio.create_task(fill())
+        assert await redis.coalesce(key, load, orjson.loads) == 'from other worker'
+        await filling
+
+        await redis.clear_cache(key, lock_key(key.key))
+
+    @pytest.mark.asyncio
+    async def test_coalesce_lock_timeout(self) -> None:
+        key = CacheKey('test:coalesce:timeout')
+        await r.set(lock_key(key.key), 'stuck worker', px=5000)
+        calls = 0
+
+        async def load() -> str:
+            nonlocal calls
+            calls += 1
+            return 'loaded'
+
+        # the lock holder never fills the cache, after cache_lock_wait we load ourselves
+        assert await redis.coalesce(key, load, orjson.loads) == 'loaded'
+        assert calls == 1
+
+        await redis.clear_cache(key, lock_key(key.key))
+
+    @pytest.mark.asyncio
+    async def test_soft_invalidated_deleted_menu(self, ac: AsyncClient, monkeypatch: pytest.MonkeyPatch) -> None:
+        # background refreshes open their own session, point them at the test database
+        monkeypatch.setattr(services, 'get_async_context', override_get_async_context)
+
+        response = await ac.post(reverse('create_menu'), json={'title': 'soft menu', 'description': ''})
+        assert response.status_code == 201
+        menu_id = response.json()['id']
+
+        url = reverse('get_menu', menu_id=menu_id)
+        assert (await ac.get(url)).status_code == 200
+
+        # the row goes away behind the cache's back, the entry is only marked stale
+        async with async_session_maker() as session:
+            assert await delete_menus(session, [menu_id]) == 1
+        await redis.invalidate(CATALOG, menu_scope(menu_id), soft=True)
+
+        for _ in range(20):
+            response = await ac.get(url)
+            if response.status_code == 404:
+                break
+            await asyncio.sleep(0.05)
+
+        assert response.status_code == 404
+        assert (await ac.get(url)).status_code == 404
+
+
+@pytest.mark.order(7)
+class TestLocalCache:
+    async def wait_for(self, condition: Callable[[], Awaitable[bool]]) -> None:
+        for _ in range(50):
+            if await condition():
+                return
+            await asyncio.sleep(0.02)
+
+        raise AssertionError('condition not met in time')
+
+    @pytest.mark.asyncio
+    async def test_local_bypassed_without_listener(self) -> None:
+        assert not redis.local_enabled
+
+        key = CacheKey('test:local:bypassed')
+        await redis.setex(key, 60, orjson.dumps('value'))
+        await redis.generations('test:local:scope')
+
+        assert (await redis.get_entry(key)).value == orjson.dumps('value')
+        assert key.key not in redis.local
+        assert 'test:local:scope' not in redis.local_generations
+
+        await redis.clear_cache(key)
+
+    @pytest.mark.asyncio
+    async def test_remote_invalidation_drops_local_generation(self) -> None:
+        scope = 'test:local:remote'
+        invalidations = redis.invalidations
+        redis.start_listener()
+
+        async def subscribed() -> bool:
+            # the listener drops everything once it is subscribed
+            return redis.invalidations > invalidations
+
+        try:
+            await self.wait_for(subscribed)
+
+            assert redis.local_enabled
+            assert await redis.generations(scope) == [(0, 0)]
+            assert redis.local_generations[scope] == (0, 0)
+
+            # another process bumps the generation and announces it
+            await r.incr(generation_key(scope))
+            await r.publish(INVALIDATION_CHANNEL, scope)
+
+            async def dropped() -> bool:
+                return scope not in redis.local_generations
+
+            await self.wait_for(dropped)
+            assert await redis.generations(scope) == [(1, 0)]
+        finally:
+            await redis.stop_listener()
+            await redis.clear_cache(generation_key(scope))
+
+        assert not redis.local_enabled
+        assert not redis.local_generations
@@ -1,6 +1,10 @@
 import pytest
 from httpx import AsyncClient
 
+from src.menu import services
+from src.menu.schemas import MenuReadNested
+from tests.conftest import override_get_async_context
+
 """
 Проверка кол-ва блюд и подменю в меню
 """
@@ -98,6 +102,25 @@ class TestSubMenuDishAPI:
         assert len(all_data[0]['submenus']) == 1
         assert len(all_data[0]['submenus'][0]['dishes']) == 2
 
+    """ check nested menus stream """
+
+    @pytest.mark.asyncio
+    async def test_menus_nested_stream(self, ac: AsyncClient, monkeypatch: pytest.MonkeyPatch) -> None:
+        # the stream opens its own session, point it at the test database
+        monkeypatch.setattr(services, 'get_async_context', override_get_async_context)
+
+        response = await ac.get('/api/v1/menus/nested/stream')
+        nested = await ac.get('/api/v1/menus/nested')
+
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/x-ndjson'
+
+        lines = response.text.splitlines()
+        assert len(lines) == 1
+        assert [MenuReadNested.model_validate_json(line) for line in lines] == [
+            MenuReadNested.model_validate(menu) for menu in nested.json()
+        ]
+
     """ check target submenu """
 
     @pytest.mark.asyncio
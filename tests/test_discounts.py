@@ -0,0 +1,102 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+from fastapi import Request
+from httpx import AsyncClient
+
+from src.core import services
+from src.dish.services import set_discounts
+from src.redis.keys import DISCOUNTS, soft_generation_key
+from src.redis.utils import redis
+from tests.conftest import override_get_async_context
+
+r = redis.get_redis_client()
+
+"""Проверка скидок: одна и та же цена в блюде, списке блюд и дереве меню"""
+
+
+@pytest.mark.order(8)
+class TestDiscounts:
+    @pytest.fixture
+    async def dish_fixture(self, ac: AsyncClient, request: Request) -> list[str]:
+        menu = await ac.post(
+            '/api/v1/menus/',
+            json={
+                'title': f'menu_for_discount_{request.node.name}',
+                'description': '',
+            },
+        )
+        assert menu.status_code == 201
+        menu_id = menu.json()['id']
+
+        submenu = await ac.post(
+            f'/api/v1/menus/{menu_id}/submenus/',
+            json={
+                'title': f'submenu_for_discount_{request.node.name}',
+                'description': '',
+            },
+        )
+        assert submenu.status_code == 201
+        submenu_id = submenu.json()['id']
+
+        dish = await ac.post(
+            f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/',
+            json={
+                'title': f'dish_for_discount_{request.node.name}',
+                'description': '',
+                'price': '10',
+            },
+        )
+        assert dish.status_code == 201
+
+        return [menu_id, submenu_id, dish.json()['id']]
+
+    async def prices(self, ac: AsyncClient, menu_id: str, submenu_id: str, dish_id: str) -> list[Decimal]:
+        dish = await ac.get(f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}')
+        dishes = await ac.get(f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/')
+        nested = await ac.get('/api/v1/menus/nested')
+
+        [menu] = [menu for menu in nested.json() if menu['id'] == menu_id]
+
+        return [
+            Decimal(str(dish.json()['price'])),
+            *(Decimal(str(row['price'])) for row in dishes.json() if row['id'] == dish_id),
+            Decimal(str(menu['submenus'][0]['dishes'][0]['price'])),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_discount_applied_everywhere(
+        self, ac: AsyncClient, dish_fixture: list[str], monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        # background refreshes open their own session, point them at the test database
+        monkeypatch.setattr(services, 'get_async_context', override_get_async_context)
+        menu_id, submenu_id, dish_id = dish_fixture
+
+        await set_discounts({dish_id: 20})
+        assert await self.prices(ac, menu_id, submenu_id, dish_id) == [Decimal('8.00')] * 3
+
+        # cached prices go stale and are recomputed with the new discount
+        await set_discounts({dish_id: 50})
+        for _ in range(20):
+            prices = await self.prices(ac, menu_id, submenu_id, dish_id)
+            if prices == [Decimal('5.00')] * 3:
+                break
+            await asyncio.sleep(0.05)
+
+        assert prices == [Decimal('5.00')] * 3
+
+        await set_discounts({})
+
+    @pytest.mark.asyncio
+    async def test_set_discounts_bumps_generation_on_change_only(self) -> None:
+        await set_discounts({'dish': 10})
+        generation = await r.get(soft_generation_key(DISCOUNTS))
+
+        assert not await set_discounts({'dish': 10, 'no discount': 0})
+        assert await r.get(soft_generation_key(DISCOUNTS)) == generation
+
+        assert await set_discounts({'dish': 15})
+        assert int(await r.get(soft_generation_key(DISCOUNTS))) == int(generation) + 1
+
+        await set_discounts({})
@@ -87,3 +87,47 @@ class TestDishAPI:
         )
 
         assert len(dishes.json()) == 4
+
+    @pytest.mark.asyncio
+    async def test_dish_create_duplicate(self, ac: AsyncClient, dish_fixture: list[str], request: Request) -> None:
+        response = await ac.post(
+            f'/api/v1/menus/{dish_fixture[0]}/submenus/{dish_fixture[1]}/dishes/',
+            json={
+                'title': f'dish_for_test_{request.node.name}',
+                'description': 'description for dish 1',
+                'price': '7.5',
+            },
+        )
+
+        assert response.status_code == 409
+        assert response.json()['detail'] == 'dish cannot be in 2 submenus at the same time'
+
+    @pytest.mark.asyncio
+    async def test_dish_create_under_other_menu_path(self, ac: AsyncClient, dish_fixture: list[str]) -> None:
+        menu_id, submenu_id = dish_fixture[:2]
+        other_menu = await ac.post(
+            '/api/v1/menus/',
+            json={
+                'title': 'other menu for dish path',
+                'description': '',
+            },
+        )
+        assert other_menu.status_code == 201
+        other_menu_id = other_menu.json()['id']
+
+        menu = await ac.get(f'/api/v1/menus/{menu_id}')
+        assert menu.json()['dishes_count'] == 1
+
+        dish = await ac.post(
+            f'/api/v1/menus/{other_menu_id}/submenus/{submenu_id}/dishes/',
+            json={
+                'title': 'dish under other menu path',
+                'description': '',
+                'price': '5',
+            },
+        )
+        assert dish.status_code == 201
+
+        # the dish lands in the real menu of the submenu, its cached counters are refreshed
+        menu = await ac.get(f'/api/v1/menus/{menu_id}')
+        assert menu.json()['dishes_count'] == 2
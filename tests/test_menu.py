@@ -36,6 +36,20 @@ class TestMenuAPI:
         )
         assert response.status_code == 201
 
+    @pytest.mark.asyncio
+    async def test_menu_create_duplicate(self, ac: AsyncClient) -> None:
+        url = reverse('create_menu')
+        response = await ac.post(
+            url,
+            json={
+                'title': 'menu 2',
+                'description': 'menu 2 description',
+            },
+        )
+
+        assert response.status_code == 409
+        assert response.json()['detail'] == 'menu with that title already exists'
+
     @pytest.mark.asyncio
     async def test_menu_patch(self, ac: AsyncClient, menu_id: str) -> None:
         url = reverse('update_menu', menu_id=menu_id)
@@ -73,3 +87,54 @@ class TestMenuAPI:
 
         assert response.status_code == 200
         assert len(response.json()) == 2
+
+    @pytest.mark.asyncio
+    async def test_menu_get_all_cursor(self, ac: AsyncClient) -> None:
+        url = reverse('get_menus')
+        first_page = await ac.get(url, params={'limit': 1})
+
+        assert first_page.status_code == 200
+        assert len(first_page.json()) == 1
+
+        cursor = first_page.headers['X-Next-Cursor']
+        second_page = await ac.get(url, params={'limit': 1, 'cursor': cursor})
+
+        assert second_page.status_code == 200
+        assert len(second_page.json()) == 1
+        assert second_page.json()[0]['id'] != first_page.json()[0]['id']
+
+    @pytest.mark.asyncio
+    async def test_menu_get_all_wrong_cursor(self, ac: AsyncClient) -> None:
+        url = reverse('get_menus')
+        response = await ac.get(url, params={'cursor': 'not a cursor'})
+
+        assert response.status_code == 400
+        assert response.json()['detail'] == 'invalid cursor'
+
+    @pytest.mark.asyncio
+    async def test_menu_get_not_modified(self, ac: AsyncClient, menu_id: str) -> None:
+        url = reverse('get_menu', menu_id=menu_id)
+        response = await ac.get(url)
+
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+
+        not_modified = await ac.get(url, headers={'If-None-Match': etag})
+
+        assert not_modified.status_code == 304
+        assert not_modified.headers['ETag'] == etag
+        assert not_modified.content == b''
+
+    @pytest.mark.asyncio
+    async def test_menu_patch_duplicate(self, ac: AsyncClient, menu_id: str) -> None:
+        url = reverse('update_menu', menu_id=menu_id)
+        response = await ac.patch(
+            url,
+            json={
+                'title': 'menu 2',
+                'description': 'menu 2 description',
+            },
+        )
+
+        assert response.status_code == 409
+        assert response.json()['detail'] == 'menu with that title already exists'
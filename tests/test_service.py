@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from src.core.metrics import METRICS_KEY, SYNC, metrics, sample_name
+from src.core.warmup import warm_up_cache
+from src.redis.stats import cache_stats
+from src.redis.utils import redis
+from tests.conftest import async_session_maker
+from tests.utils import reverse
+
+r = redis.get_redis_client()
+
+"""Проверка служебных эндпоинтов"""
+
+
+@pytest.mark.order(5)
+class TestServiceAPI:
+    @pytest.mark.asyncio
+    async def test_db_pool_status(self, ac: AsyncClient) -> None:
+        url = reverse('db_pool_status')
+        response = await ac.get(url)
+
+        assert response.status_code == 200
+        assert 'pool' in response.json()
+
+    @pytest.mark.asyncio
+    async def test_cache_status(self, ac: AsyncClient) -> None:
+        url = reverse('cache_status')
+        response = await ac.get(url)
+
+        assert response.status_code == 200
+        assert all('hit_ratio' in family for family in response.json().values())
+
+    @pytest.mark.asyncio
+    async def test_clear_cache_iterables(self) -> None:
+        keys = [f'test:clear:{index}' for index in range(3)]
+        for key in keys:
+            await r.set(key, 1)
+        await r.set(str(keys), 1)
+
+        await redis.clear_cache('test:clear:missing', keys)
+
+        assert await r.exists(*keys) == 0
+        assert await r.exists(str(keys)) == 1
+
+        await redis.clear_cache(str(keys))
+
+    @pytest.mark.asyncio
+    async def test_warm_up_cache(self, ac: AsyncClient) -> None:
+        assert await warm_up_cache(async_session_maker) >= 0
+
+        misses = sum(family.misses for family in cache_stats.families.values())
+        response = await ac.get(reverse('get_menus'))
+
+        assert response.status_code == 200
+        assert sum(family.misses for family in cache_stats.families.values()) == misses
+
+    @pytest.mark.asyncio
+    async def test_prometheus_metrics(self, ac: AsyncClient) -> None:
+        await ac.get(reverse('get_menus'))
+        response = await ac.get(reverse('prometheus_metrics'))
+
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('text/plain')
+        assert 'cafe_http_request_duration_seconds_bucket{route="get_menus"' in response.text
+        assert 'cafe_cache_misses_total{family=' in response.text
+
+    @pytest.mark.asyncio
+    async def test_concurrent_metrics_flush(self) -> None:
+        metrics.histogram(SYNC, phase='test').observe(0.01)
+        name = sample_name(f'{SYNC}_count', phase='test')
+
+        await asyncio.gather(metrics.flush(r), metrics.flush(r))
+
+        assert int(await r.hget(METRICS_KEY, name)) == 1
+
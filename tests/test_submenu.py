@@ -73,3 +73,18 @@ class TestSubMenuAPI:
         )
 
         assert len(submenus.json()) == 1
+
+    @pytest.mark.asyncio
+    async def test_submenu_create_duplicate(
+        self, ac: AsyncClient, submenu_fixture: list[str], request: Request
+    ) -> None:
+        response = await ac.post(
+            f'/api/v1/menus/{submenu_fixture[0]}/submenus/',
+            json={
+                'title': f'submenu_for_test_{request.node.name}',
+                'description': 'description for submenu 1',
+            },
+        )
+
+        assert response.status_code == 409
+        assert response.json()['detail'] == 'submenu cannot be in 2 menus at the same time'
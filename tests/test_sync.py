@@ -0,0 +1,305 @@
+import uuid
+from decimal import Decimal
+from typing import Any
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.models import Dish, Menu, SubMenu
+from src.dish.crud import upsert_dishes
+from src.menu.crud import delete_menus, upsert_menus
+from src.submenu.crud import upsert_submenus
+from tasks.update_db import apply_plan, load_tree, plan_sync
+from tests.conftest import async_session_maker
+
+"""Проверка плана синхронизации с google_sheet и bulk crud"""
+
+
+@pytest.mark.order(6)
+class TestSyncPlan:
+    @pytest.fixture
+    def tree(self) -> dict[type, dict[uuid.UUID, dict[str, Any]]]:
+        menu_id, submenu_id, old_submenu_id, dish_id, old_dish_id = (uuid.uuid4() for _ in range(5))
+
+        return {
+            Menu: {menu_id: {'id': menu_id, 'title': 'menu', 'description': 'menu description'}},
+            SubMenu: {
+                submenu_id: {'id': submenu_id, 'title': 'submenu', 'description': '', 'menu_id': menu_id},
+                old_submenu_id: {'id': old_submenu_id, 'title': 'old submenu', 'description': '', 'menu_id': menu_id},
+            },
+            Dish: {
+                dish_id: {
+                    'id': dish_id, 'title': 'dish', 'description': '', 'price': Decimal('10.50'),
+                    'submenu_id': submenu_id,
+                },
+                old_dish_id: {
+                    'id': old_dish_id, 'title': 'old dish', 'description': '', 'price': Decimal('1.00'),
+                    'submenu_id': old_submenu_id,
+                },
+            },
+        }
+
+    def sheet(self, tree: dict[type, dict[uuid.UUID, dict[str, Any]]]) -> list[dict[str, Any]]:
+        menu_id = next(iter(tree[Menu]))
+        dish_id = next(iter(tree[Dish]))
+
+        return [{
+            'id': str(menu_id), 'index': 0, 'title': 'menu', 'description': 'menu description',
+            'submenus': [{
+                'id': '', 'index': 1, 'title': 'submenu', 'description': '',
+                'dishes': [{
+                    'id': str(dish_id), 'index': 2, 'title': 'dish', 'description': '', 'price': '10.5',
+                    'discount': 5,
+                }],
+            }],
+        }]
+
+    def test_plan_unchanged(self, tree: dict) -> None:
+        sheet = self.sheet(tree)
+        plan = plan_sync(sheet, tree)
+        submenu_id = next(iter(tree[SubMenu]))
+
+        assert not plan.create[Menu] and not plan.update[Menu]
+        assert not plan.create[Dish] and not plan.update[Dish]
+        # matched by title, only the missing id is written back
+        assert plan.sheet_ids == [('B', 1, str(submenu_id))]
+        assert plan.discounts == {sheet[0]['submenus'][0]['dishes'][0]['id']: 5}
+
+    def test_plan_changes(self, tree: dict) -> None:
+        sheet = self.sheet(tree)
+        sheet[0]['submenus'][0]['dishes'][0]['price'] = '12'
+        sheet[0]['submenus'][0]['dishes'].append(
+            {'id': 'new', 'index': 3, 'title': 'new dish', 'description': '', 'price': '3', 'discount': 0}
+        )
+        plan = plan_sync(sheet, tree)
+        menu_id = next(iter(tree[Menu]))
+        old_submenu_id, old_dish_id = list(tree[SubMenu])[1], list(tree[Dish])[1]
+
+        assert [row['price'] for row in plan.update[Dish]] == [Decimal('12.00')]
+        assert [row['title'] for row in plan.create[Dish]] == ['new dish']
+        assert ('C', 3, str(plan.create[Dish][0]['id'])) in plan.sheet_ids
+        assert plan.delete[SubMenu] == {old_submenu_id}
+        assert plan.delete[Dish] == {old_dish_id}
+        # rows are deleted from the menu, its cache is dropped, not served stale
+        assert plan.hard_menu_ids == {menu_id}
+        assert not plan.menu_ids
+
+    def test_plan_update_in_place(self, tree: dict) -> None:
+        sheet = self.sheet(tree)
+        menu_id = next(iter(tree[Menu]))
+        old_submenu_id, old_dish_id = list(tree[SubMenu])[1], list(tree[Dish])[1]
+        sheet[0]['submenus'][0]['dishes'][0]['price'] = '12'
+        sheet[0]['submenus'].append({
+            'id': str(old_submenu_id), 'index': 3, 'title': 'old submenu', 'description': '',
+            'dishes': [{
+                'id': str(old_dish_id), 'index': 4, 'title': 'old dish', 'description': '', 'price': '1',
+                'discount': 0,
+            }],
+        })
+        plan = plan_sync(sheet, tree)
+
+        assert not any(plan.delete.values())
+        assert plan.menu_ids == {menu_id}
+        assert not plan.hard_menu_ids
+
+    def test_plan_moves(self, tree: dict) -> None:
+        sheet = self.sheet(tree)
+        menu_id = next(iter(tree[Menu]))
+        old_submenu_id, old_dish_id = list(tree[SubMenu])[1], list(tree[Dish])[1]
+        sheet.append({
+            'id': '', 'index': 3, 'title': 'menu 2', 'description': '',
+            'submenus': [{
+                'id': str(old_submenu_id), 'index': 4, 'title': 'old submenu', 'description': '',
+                'dishes': [{
+                    'id': str(old_dish_id), 'index': 5, 'title': 'old dish', 'description': '', 'price': '1',
+                    'discount': 0,
+                }],
+            }],
+        })
+        plan = plan_sync(sheet, tree)
+        new_menu_id = plan.create[Menu][0]['id']
+
+        assert [row['menu_id'] for row in plan.update[SubMenu]] == [new_menu_id]
+        assert not any(plan.delete.values())
+        assert plan.hard_menu_ids == {menu_id, new_menu_id}
+        assert not plan.menu_ids
+
+
+@pytest.mark.order(6)
+class TestBulkCrud:
+    async def menu_counters(self, session: AsyncSession, menu_id: str) -> tuple[int, int]:
+        menu = await session.get(Menu, menu_id, populate_existing=True)
+        assert menu is not None
+        return menu.submenus_count, menu.dishes_count
+
+    async def submenu_counter(self, session: AsyncSession, submenu_id: str) -> int:
+        submenu = await session.get(SubMenu, submenu_id, populate_existing=True)
+        assert submenu is not None
+        return submenu.dishes_count
+
+    @pytest.mark.asyncio
+    async def test_bulk_upsert_and_delete(self) -> None:
+        async with async_session_maker() as session:
+            menus = await upsert_menus(
+                session, [{'title': f'bulk menu {index}', 'description': ''} for index in range(3)]
+            )
+            assert len(menus) == 3
+
+            updated = await upsert_menus(
+                session, [{'id': menu.id, 'title': f'{menu.title} updated', 'description': 'new'} for menu in menus]
+            )
+            assert {menu.id for menu in updated} == {menu.id for menu in menus}
+            assert all(menu.title.endswith('updated') and menu.description == 'new' for menu in updated)
+
+            assert await delete_menus(session, [menu.id for menu in menus]) == 3
+            assert await delete_menus(session, []) == 0
+
+    @pytest.mark.asyncio
+    async def test_bulk_upsert_children(self) -> None:
+        async with async_session_maker() as session:
+            menu, other_menu = await upsert_menus(
+                session, [{'title': f'bulk parent {index}', 'description': ''} for index in range(2)]
+            )
+            submenu, other_submenu = await upsert_submenus(
+                session,
+                [{'title': f'bulk submenu {index}', 'description': '', 'menu_id': menu.id} for index in range(2)],
+            )
+            dishes = await upsert_dishes(
+                session, [{
+                    'title': f'bulk dish {index}', 'description': '', 'price': Decimal('1.50'),
+                    'submenu_id': submenu.id,
+                } for index in range(3)],
+            )
+
+            assert await self.menu_counters(session, menu.id) == (2, 3)
+            assert await self.submenu_counter(session, submenu.id) == 3
+
+            # a dish moved to the other submenu of the same menu
+            moved = await upsert_dishes(
+                session, [{
+                    'id': dishes[0].id, 'title': 'bulk dish moved', 'description': '', 'price': Decimal('2.00'),
+                    'submenu_id': other_submenu.id,
+                }],
+            )
+            assert moved[0].title == 'bulk dish moved' and moved[0].submenu_id == other_submenu.id
+            assert await self.menu_counters(session, menu.id) == (2, 3)
+            assert await self.submenu_counter(session, submenu.id) == 2
+            assert await self.submenu_counter(session, other_submenu.id) == 1
+
+            # the submenu moves to another menu with its dish
+            moved_submenus = await upsert_submenus(
+                session, [{
+                    'id': other_submenu.id, 'title': 'bulk submenu moved', 'description': '',
+                    'menu_id': other_menu.id,
+                }],
+            )
+            assert moved_submenus[0].menu_id == other_menu.id
+            assert await self.menu_counters(session, menu.id) == (1, 2)
+            assert await self.menu_counters(session, other_menu.id) == (1, 1)
+
+            # a dish moved across menus
+            await upsert_dishes(
+                session, [{
+                    'id': dishes[1].id, 'title': dishes[1].title, 'description': '', 'price': Decimal('1.50'),
+                    'submenu_id': other_submenu.id,
+                }],
+            )
+            assert await self.menu_counters(session, menu.id) == (1, 1)
+            assert await self.menu_counters(session, other_menu.id) == (1, 2)
+            assert await self.submenu_counter(session, other_submenu.id) == 2
+
+            assert await delete_menus(session, [menu.id, other_menu.id]) == 2
+
+
+@pytest.mark.order(6)
+class TestSyncApply:
+    @pytest.fixture
+    async def rows(self, request: pytest.FixtureRequest) -> dict[str, str]:
+        name = request.node.name
+        async with async_session_maker() as session:
+            menu, other_menu = await upsert_menus(
+                session, [{'title': f'{name} menu {index}', 'description': ''} for index in range(2)]
+            )
+            submenu, other_submenu = await upsert_submenus(
+                session,
+                [{'title': f'{name} submenu {index}', 'description': '', 'menu_id': menu.id} for index in range(2)],
+            )
+            dish, other_dish = await upsert_dishes(
+                session, [{
+                    'title': f'{name} dish {index}', 'description': '', 'price': Decimal('1.00'),
+                    'submenu_id': row.id,
+                } for index, row in enumerate((submenu, other_submenu))],
+            )
+
+        return {
+            'menu': menu.id, 'other_menu': other_menu.id, 'submenu': submenu.id, 'other_submenu': other_submenu.id,
+            'dish': dish.id, 'other_dish': other_dish.id,
+        }
+
+    async def apply(self, rows: dict[str, str], sheet: list[dict[str, Any]]) -> dict[type, dict[uuid.UUID, str]]:
+        async with async_session_maker() as session:
+            async with session.begin():
+                # only the rows of this test, the rest of the database is not in the sheet
+                tree = {
+                    model: {row_id: row for row_id, row in model_rows.items() if row_id in rows.values()}
+                    for model, model_rows in (await load_tree(session)).items()
+                }
+                await apply_plan(session, plan_sync(sheet, tree))
+
+            tree = await load_tree(session)
+
+        return {
+            model: {row_id: row['title'] for row_id, row in model_rows.items() if row_id in rows.values()}
+            for model, model_rows in tree.items()
+        }
+
+    def row(self, row_id: str, title: str, children: str | None = None, **values: Any) -> dict[str, Any]:
+        row = {'id': str(row_id), 'index': 0, 'title': title, 'description': '', **values}
+        if children:
+            row[children] = []
+        return row
+
+    @pytest.mark.asyncio
+    async def test_rename_onto_deleted_title(self, rows: dict[str, str], request: pytest.FixtureRequest) -> None:
+        name = request.node.name
+        menu = self.row(rows['menu'], f'{name} menu 1', 'submenus')
+        submenu = self.row(rows['other_submenu'], f'{name} submenu 0', 'dishes')
+        submenu['dishes'].append(self.row(rows['other_dish'], f'{name} dish 0', price='1', discount=0))
+        menu['submenus'].append(submenu)
+
+        # the other menu, the first submenu and its dish are deleted, the survivors take their titles
+        titles = await self.apply(rows, [menu])
+
+        assert titles == {
+            Menu: {rows['menu']: f'{name} menu 1'},
+            SubMenu: {rows['other_submenu']: f'{name} submenu 0'},
+            Dish: {rows['other_dish']: f'{name} dish 0'},
+        }
+
+        async with async_session_maker() as session:
+            await delete_menus(session, [rows['menu']])
+
+    @pytest.mark.asyncio
+    async def test_title_swap(self, rows: dict[str, str], request: pytest.FixtureRequest) -> None:
+        name = request.node.name
+        menus = [
+            self.row(rows['menu'], f'{name} menu 1', 'submenus'),
+            self.row(rows['other_menu'], f'{name} menu 0', 'submenus'),
+        ]
+
+        for submenu_id, dish_id, index in (('submenu', 'dish', 1), ('other_submenu', 'other_dish', 0)):
+            submenu = self.row(rows[submenu_id], f'{name} submenu {index}', 'dishes')
+            submenu['dishes'].append(self.row(rows[dish_id], f'{name} dish {index}', price='1', discount=0))
+            menus[0]['submenus'].append(submenu)
+
+        titles = await self.apply(rows, menus)
+
+        assert titles == {
+            Menu: {rows['menu']: f'{name} menu 1', rows['other_menu']: f'{name} menu 0'},
+            SubMenu: {rows['submenu']: f'{name} submenu 1', rows['other_submenu']: f'{name} submenu 0'},
+            Dish: {rows['dish']: f'{name} dish 1', rows['other_dish']: f'{name} dish 0'},
+        }
+
+        async with async_session_maker() as session:
+            await delete_menus(session, [rows['menu'], rows['other_menu']])
+